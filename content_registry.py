@@ -10,22 +10,31 @@ Watch ~/Downloads, auto-register files, track licenses.
 Run:
     python3 content_registry.py              # Start server
     python3 content_registry.py --watch      # Watch Downloads folder
+    python3 content_registry.py --verify-batch manifest.txt   # "uuid path" per line
+    python3 content_registry.py --verify-chunks UUID PATH [--sample N]
 
 Server runs on: http://localhost:5051
 """
 
 import sqlite3
 import secrets
+import base64
 import hashlib
 import json
 import os
+import random
 import sys
+import threading
 import uuid as uuid_lib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 from pathlib import Path
 
+from ratelimit import RateLimiter, client_ip
+
 DB = "content.db"
 PORT = 5051
 
@@ -38,6 +47,21 @@ CONFIG = {
     "tagline": "Register content. Prove ownership. License freely.",
     "version": "1.0.0",
     "watch_folder": str(Path.home() / "Downloads"),
+    "watch_cache_size": 4096,  # recently processed paths kept in memory
+    "store_folder": str(Path.home() / ".d2d" / "store"),  # content-addressed uploads
+    "max_upload_bytes": 10 * 1024 ** 3,  # 10 GB
+    "upload_chunk_size": 1024 * 1024,
+    "request_timeout": 60,  # seconds a connection may stall mid-request before it's dropped
+    "verify_workers": os.cpu_count() or 4,  # parallel rehashing in batch verify
+    "verify_roots": None,  # folders /verify/batch may read; None = watch_folder + store_folder
+    "merkle_chunk_size": 4 * 1024 * 1024,  # 4 MB leaves
+    "merkle_min_size": 64 * 1024 * 1024,  # files this big also get chunk hashes
+    "certificate_cache_size": 2048,  # rendered certificates kept in memory
+    "list_max_limit": 500,  # page size cap for /api/content
+    "rate_limit": (10, 50),  # requests/sec and burst, per client IP
+    "token_rate_limit": (5, 50),  # per X-Token, on top of the IP limit
+    "write_rate_limit": (1, 10),  # POSTs (register, upload, batch verify) per client IP
+    "trusted_proxy": "cloudflare",  # where client IPs come from; see ratelimit.client_ip
     "licenses": {
         "CC0-1.0": "Public Domain (No Rights Reserved)",
         "CC-BY-4.0": "Attribution 4.0 International",
@@ -89,6 +113,35 @@ def init_db():
         )
     """)
 
+    # Columns added after the first release
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(content)")}
+    if "merkle_root" not in columns:
+        conn.execute("ALTER TABLE content ADD COLUMN merkle_root TEXT")
+        conn.execute("ALTER TABLE content ADD COLUMN chunk_size INTEGER")
+
+    # Per-chunk hashes for large files (Merkle leaves)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS content_chunks (
+            content_id INTEGER,
+            idx INTEGER,
+            chunk_hash TEXT,
+            PRIMARY KEY (content_id, idx),
+            FOREIGN KEY (content_id) REFERENCES content(id)
+        ) WITHOUT ROWID
+    """)
+
+    # Rendered certificates (immutable once written)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS certificates (
+            uuid TEXT,
+            format TEXT,
+            body BLOB,
+            etag TEXT,
+            generated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (uuid, format)
+        ) WITHOUT ROWID
+    """)
+
     # Export history
     conn.execute("""
         CREATE TABLE IF NOT EXISTS exports (
@@ -111,6 +164,40 @@ def init_db():
         )
     """)
 
+    # Files the watcher has already handled (survives restarts)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS watched_files (
+            filepath TEXT PRIMARY KEY,
+            filesize INTEGER,
+            mtime REAL,
+            file_hash TEXT,
+            processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    # Normalized tags (content.tags keeps the original comma-separated text)
+    has_tags_table = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_tags'"
+    ).fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS content_tags (
+            tag TEXT,
+            content_id INTEGER,
+            PRIMARY KEY (tag, content_id),
+            FOREIGN KEY (content_id) REFERENCES content(id)
+        ) WITHOUT ROWID
+    """)
+    if not has_tags_table:
+        rows = conn.execute("SELECT id, tags FROM content WHERE tags != ''").fetchall()
+        conn.executemany(
+            "INSERT OR IGNORE INTO content_tags (tag, content_id) VALUES (?, ?)",
+            [(tag, content_id) for content_id, tags in rows for tag in parse_tags(tags)]
+        )
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_content_file_hash ON content(file_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_content_user_registered ON content(user_id, registered_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_content_tags_content ON content_tags(content_id)")
+
     conn.commit()
     conn.close()
 
@@ -157,6 +244,157 @@ def hash_file(filepath):
             sha256.update(chunk)
     return sha256.hexdigest()
 
+# ============================================================================
+# CHUNKED (MERKLE) HASHING
+# ============================================================================
+# The full-file SHA256 stays the canonical value on certificates. Large files
+# also store one SHA256 per fixed-size chunk plus the Merkle root over them,
+# so verification can sample chunks and point at the exact range that changed.
+
+class ChunkHasher:
+    """Full-file SHA256 and per-chunk SHA256s from a single pass over a stream."""
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or CONFIG["merkle_chunk_size"]
+        self.full = hashlib.sha256()
+        self.chunk = hashlib.sha256()
+        self.filled = 0
+        self.leaves = []
+
+    def update(self, data):
+        self.full.update(data)
+        view = memoryview(data)
+        while view:
+            take = min(len(view), self.chunk_size - self.filled)
+            self.chunk.update(view[:take])
+            self.filled += take
+            view = view[take:]
+            if self.filled == self.chunk_size:
+                self.leaves.append(self.chunk.hexdigest())
+                self.chunk = hashlib.sha256()
+                self.filled = 0
+
+    def finish(self):
+        """Return (file_hash, chunk_hashes)."""
+        if self.filled or not self.leaves:
+            self.leaves.append(self.chunk.hexdigest())
+        return self.full.hexdigest(), self.leaves
+
+def merkle_root(leaves):
+    """Root over hex leaf hashes (odd nodes are paired with themselves)."""
+    level = [bytes.fromhex(h) for h in leaves] or [hashlib.sha256(b"").digest()]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [
+            hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest()
+            for i in range(0, len(level), 2)
+        ]
+    return level[0].hex()
+
+def hash_file_with_chunks(filepath, chunk_size=None):
+    """Hash a file once, returning (file_hash, chunk_hashes)."""
+    hasher = ChunkHasher(chunk_size)
+    with open(filepath, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            hasher.update(chunk)
+    return hasher.finish()
+
+def hash_chunk(filepath, index, chunk_size):
+    """SHA256 of one chunk, read independently so chunks can run in parallel."""
+    sha256 = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        f.seek(index * chunk_size)
+        remaining = chunk_size
+        while remaining > 0 and (data := f.read(min(1024 * 1024, remaining))):
+            sha256.update(data)
+            remaining -= len(data)
+    return sha256.hexdigest()
+
+def hash_chunks(filepath, indexes, chunk_size, workers=None):
+    """Hash the given chunk indexes across a thread pool (hashlib drops the GIL)."""
+    with ThreadPoolExecutor(max_workers=workers or CONFIG["verify_workers"]) as pool:
+        hashes = pool.map(lambda i: hash_chunk(filepath, i, chunk_size), indexes)
+        return dict(zip(indexes, hashes))
+
+def verify_chunks(content_uuid, filepath, sample=None, ranges=None, workers=None):
+    """Check a file against its stored chunk hashes.
+
+    sample=N checks N random chunks, ranges=[(start, end)] checks the chunks
+    covering those byte ranges, neither checks every chunk in parallel.
+    Returns (ok, message, bad_ranges) where bad_ranges are byte offsets.
+    """
+    conn = get_db()
+    content = conn.execute(
+        "SELECT id, filesize, chunk_size FROM content WHERE uuid = ?", (content_uuid,)
+    ).fetchone()
+    if not content:
+        conn.close()
+        return False, "UUID not found", []
+    if not content["chunk_size"]:
+        conn.close()
+        return False, "No chunk hashes stored for this content", []
+
+    stored = [r["chunk_hash"] for r in conn.execute(
+        "SELECT chunk_hash FROM content_chunks WHERE content_id = ? ORDER BY idx", (content["id"],)
+    )]
+    conn.close()
+
+    chunk_size = content["chunk_size"]
+    if not Path(filepath).is_file():
+        return False, "File not found", []
+    try:
+        filesize = os.path.getsize(filepath)
+    except OSError as e:
+        return False, f"Read error: {e}", []
+    if filesize != content["filesize"]:
+        return False, "File size differs from registration", [(0, content["filesize"])]
+
+    if ranges:
+        indexes = sorted({
+            i for start, end in ranges
+            for i in range(start // chunk_size, (max(start, end - 1) // chunk_size) + 1)
+            if i < len(stored)
+        })
+    elif sample:
+        indexes = sorted(random.sample(range(len(stored)), min(sample, len(stored))))
+    else:
+        indexes = list(range(len(stored)))
+
+    try:
+        current = hash_chunks(filepath, indexes, chunk_size, workers)
+    except OSError as e:
+        return False, f"Read error: {e}", []
+    bad = [
+        (i * chunk_size, min((i + 1) * chunk_size, content["filesize"]))
+        for i in indexes if current[i] != stored[i]
+    ]
+
+    if bad:
+        return False, f"{len(bad)} of {len(indexes)} checked chunks modified", bad
+    return True, f"{len(indexes)} of {len(stored)} chunks match", []
+
+def check_quota(conn, user_id):
+    """Return an error message if the user hit their monthly limit."""
+    month = datetime.now().strftime("%Y-%m")
+    user = conn.execute("SELECT tier FROM users WHERE id = ?", (user_id,)).fetchone()
+
+    if user:
+        tier = user["tier"]
+        limit = CONFIG["tiers"][tier]["files_per_month"]
+
+        if limit > 0:  # -1 = unlimited
+            usage = conn.execute(
+                "SELECT files_registered FROM usage WHERE user_id = ? AND month = ?",
+                (user_id, month)
+            ).fetchone()
+
+            current = usage["files_registered"] if usage else 0
+
+            if current >= limit:
+                return f"Monthly limit reached ({limit} files)"
+    return None
+
 def register_content(filepath, user_id, license="Proprietary", tags="", notes="", auto=False):
     """Register a file and return its UUID."""
     path = Path(filepath)
@@ -164,41 +402,50 @@ def register_content(filepath, user_id, license="Proprietary", tags="", notes=""
     if not path.exists():
         return None, "File not found"
 
-    # Generate UUID and hash
-    content_uuid = str(uuid_lib.uuid4())
-    file_hash = hash_file(filepath)
     filesize = path.stat().st_size
+    chunks = None
 
-    conn = get_db()
-
-    # Check usage limits
-    if not auto:  # Don't count auto-registered files against limit
-        month = datetime.now().strftime("%Y-%m")
-        user = conn.execute("SELECT tier FROM users WHERE id = ?", (user_id,)).fetchone()
+    if filesize >= CONFIG["merkle_min_size"]:
+        file_hash, chunks = hash_file_with_chunks(filepath)
+    else:
+        file_hash = hash_file(filepath)
 
-        if user:
-            tier = user["tier"]
-            limit = CONFIG["tiers"][tier]["files_per_month"]
+    return save_content(file_hash, path.name, str(path), filesize, user_id, license, tags, notes, auto, chunks)
 
-            if limit > 0:  # -1 = unlimited
-                usage = conn.execute(
-                    "SELECT files_registered FROM usage WHERE user_id = ? AND month = ?",
-                    (user_id, month)
-                ).fetchone()
+def save_content(file_hash, filename, filepath, filesize, user_id, license="Proprietary", tags="", notes="", auto=False, chunks=None):
+    """Record an already-hashed file (and optional chunk hashes) and return its UUID."""
+    content_uuid = str(uuid_lib.uuid4())
 
-                current = usage["files_registered"] if usage else 0
+    conn = get_db()
 
-                if current >= limit:
-                    conn.close()
-                    return None, f"Monthly limit reached ({limit} files)"
+    # Check usage limits
+    if not auto:  # Don't count auto-registered files against limit
+        error = check_quota(conn, user_id)
+        if error:
+            conn.close()
+            return None, error
 
     # Insert content
     try:
-        conn.execute("""
+        cur = conn.execute("""
             INSERT INTO content
-            (uuid, file_hash, filename, filepath, filesize, user_id, license, tags, notes, auto_registered)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (content_uuid, file_hash, path.name, str(path), filesize, user_id, license, tags, notes, auto))
+            (uuid, file_hash, filename, filepath, filesize, user_id, license, tags, notes, auto_registered,
+             merkle_root, chunk_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (content_uuid, file_hash, filename, filepath, filesize, user_id, license, tags, notes, auto,
+              merkle_root(chunks) if chunks else None,
+              CONFIG["merkle_chunk_size"] if chunks else None))
+
+        conn.executemany(
+            "INSERT OR IGNORE INTO content_tags (tag, content_id) VALUES (?, ?)",
+            [(tag, cur.lastrowid) for tag in parse_tags(tags)]
+        )
+
+        if chunks:
+            conn.executemany(
+                "INSERT INTO content_chunks (content_id, idx, chunk_hash) VALUES (?, ?, ?)",
+                [(cur.lastrowid, i, h) for i, h in enumerate(chunks)]
+            )
 
         # Update usage
         month = datetime.now().strftime("%Y-%m")
@@ -211,6 +458,7 @@ def register_content(filepath, user_id, license="Proprietary", tags="", notes=""
         conn.commit()
         conn.close()
 
+        store_certificates(content_uuid)
         return content_uuid, None
 
     except Exception as e:
@@ -231,15 +479,67 @@ def get_content(content_uuid):
 
 def get_user_content(user_id, limit=100):
     """Get all content registered by a user."""
-    conn = get_db()
-    rows = conn.execute("""
-        SELECT * FROM content
+    rows, _ = list_content(user_id, limit=limit)
+    return rows
+
+def parse_tags(tags):
+    """Split a comma-separated tag string into clean, unique tags."""
+    return list(dict.fromkeys(t.strip().lower() for t in (tags or "").split(",") if t.strip()))
+
+def encode_cursor(row):
+    return base64.urlsafe_b64encode(json.dumps([row["registered_at"], row["id"]]).encode()).decode()
+
+def decode_cursor(cursor):
+    registered_at, content_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return registered_at, int(content_id)
+
+def list_content(user_id, license=None, tag=None, since=None, until=None,
+                 min_size=None, max_size=None, cursor=None, limit=100):
+    """One page of a user's content, newest first, with keyset pagination.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Ordering is (registered_at, id) so it's served by idx_content_user_registered.
+    """
+    limit = max(1, min(int(limit), CONFIG["list_max_limit"]))
+    sql = """
+        SELECT id, uuid, file_hash, filename, filesize, license, tags, notes,
+               auto_registered, registered_at, merkle_root
+        FROM content c
         WHERE user_id = ?
-        ORDER BY registered_at DESC
-        LIMIT ?
-    """, (user_id, limit)).fetchall()
+    """
+    args = [user_id]
+
+    if license:
+        sql += " AND license = ?"
+        args.append(license)
+    if tag:
+        sql += " AND id IN (SELECT content_id FROM content_tags WHERE tag = ?)"
+        args.append(tag.strip().lower())
+    if since:
+        sql += " AND registered_at >= ?"
+        args.append(since)
+    if until:
+        sql += " AND registered_at < ?"
+        args.append(until)
+    if min_size is not None:
+        sql += " AND filesize >= ?"
+        args.append(int(min_size))
+    if max_size is not None:
+        sql += " AND filesize <= ?"
+        args.append(int(max_size))
+    if cursor:
+        sql += " AND (registered_at, id) < (?, ?)"
+        args.extend(decode_cursor(cursor))
+
+    sql += " ORDER BY registered_at DESC, id DESC LIMIT ?"
+    args.append(limit + 1)
+
+    conn = get_db()
+    rows = [dict(r) for r in conn.execute(sql, args).fetchall()]
     conn.close()
-    return [dict(r) for r in rows]
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
 
 def verify_content(content_uuid, filepath):
     """Verify a file matches its registered hash."""
@@ -254,17 +554,181 @@ def verify_content(content_uuid, filepath):
     else:
         return False, "File has been modified (hash mismatch)"
 
+def get_file_hashes(content_uuids):
+    """Map UUID -> registered hash for many UUIDs in a single query."""
+    conn = get_db()
+    rows = conn.execute(
+        "SELECT uuid, file_hash FROM content WHERE uuid IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(content_uuids)),)
+    ).fetchall()
+    conn.close()
+    return {r["uuid"]: r["file_hash"] for r in rows}
+
+def verify_roots():
+    roots = CONFIG["verify_roots"] or [CONFIG["watch_folder"], CONFIG["store_folder"]]
+    return [os.path.realpath(r) for r in roots]
+
+def path_allowed(filepath, roots):
+    """True if filepath (after resolving symlinks and ..) is inside one of roots."""
+    real = os.path.realpath(filepath)
+    return any(os.path.commonpath([real, root]) == root for root in roots)
+
+def _verify_one(content_uuid, filepath, expected, roots=None):
+    result = {"uuid": content_uuid, "path": filepath, "ok": False}
+    if roots is not None and not path_allowed(filepath, roots):
+        result["message"] = "Path not allowed"  # said before touching the file, so existence doesn't leak
+    elif expected is None:
+        result["message"] = "UUID not found"
+    elif not Path(filepath).is_file():
+        result["message"] = "File not found"
+    else:
+        try:
+            matches = hash_file(filepath) == expected
+        except OSError as e:
+            result["message"] = f"Read error: {e}"
+        else:
+            result["ok"] = matches
+            result["message"] = "File matches registered hash" if matches else "File has been modified (hash mismatch)"
+    return result
+
+def verify_batch(items, workers=None, roots=None):
+    """Verify many (uuid, path) pairs, yielding a result per item as it finishes.
+
+    Records are fetched in one query and files are rehashed in parallel
+    (hashlib releases the GIL while hashing). With roots, paths outside
+    those folders are refused without being read.
+    """
+    items = list(items)
+    hashes = get_file_hashes({u for u, _ in items})
+
+    with ThreadPoolExecutor(max_workers=workers or CONFIG["verify_workers"]) as pool:
+        futures = [pool.submit(_verify_one, u, p, hashes.get(u), roots) for u, p in items]
+        for future in as_completed(futures):
+            yield future.result()
+
+def parse_manifest(text):
+    """Parse a verify manifest: JSON ([{uuid, path}] or [[uuid, path]]) or 'uuid path' lines."""
+    text = text.strip()
+    if text.startswith(("[", "{")):
+        data = json.loads(text)
+        if isinstance(data, dict):
+            data = data.get("items", [])
+        return [
+            (i["uuid"], i["path"]) if isinstance(i, dict) else (i[0], i[1])
+            for i in data
+        ]
+
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            content_uuid, _, filepath = line.partition(" ")
+            items.append((content_uuid, filepath.strip()))
+    return items
+
+# ============================================================================
+# STREAMING UPLOADS
+# ============================================================================
+
+def iter_body(rfile, length=None, chunked=False, chunk_size=None):
+    """Yield a request body piece by piece (Content-Length or chunked)."""
+    chunk_size = chunk_size or CONFIG["upload_chunk_size"]
+
+    if not chunked:
+        remaining = length or 0
+        while remaining > 0:
+            data = rfile.read(min(chunk_size, remaining))
+            if not data:
+                raise ValueError("Upload ended early")
+            remaining -= len(data)
+            yield data
+        return
+
+    while True:
+        line = rfile.readline(1024)
+        if not line:
+            raise ValueError("Upload ended early")
+        size = int(line.split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            # Skip trailers up to the blank line
+            while rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                pass
+            return
+        while size > 0:
+            data = rfile.read(min(chunk_size, size))
+            if not data:
+                raise ValueError("Upload ended early")
+            size -= len(data)
+            yield data
+        rfile.readline(1024)  # CRLF after each chunk
+
+def receive_upload(rfile, length=None, chunked=False, store=False, max_bytes=None):
+    """Hash an upload as it arrives, optionally spooling it to the store.
+
+    Memory use is one chunk regardless of file size. Returns
+    (file_hash, filesize, stored_path, chunk_hashes, error); chunk_hashes is
+    None below CONFIG["merkle_min_size"].
+    """
+    max_bytes = max_bytes or CONFIG["max_upload_bytes"]
+    if length is not None and length > max_bytes:
+        return None, 0, None, None, f"Upload too large (max {max_bytes} bytes)"
+
+    hasher = ChunkHasher()
+    size = 0
+    spool = None
+
+    if store:
+        store_dir = Path(CONFIG["store_folder"])
+        store_dir.mkdir(parents=True, exist_ok=True)
+        spool_path = store_dir / f".upload-{secrets.token_hex(8)}"
+        spool = open(spool_path, "wb")
+
+    try:
+        for data in iter_body(rfile, length, chunked):
+            size += len(data)
+            if size > max_bytes:
+                raise ValueError(f"Upload too large (max {max_bytes} bytes)")
+            hasher.update(data)
+            if spool:
+                spool.write(data)
+
+        file_hash, chunks = hasher.finish()
+        if size < CONFIG["merkle_min_size"]:
+            chunks = None
+        stored_path = None
+
+        if spool:
+            spool.close()
+            # Content-addressed: store/ab/abcdef...
+            target = Path(CONFIG["store_folder"]) / file_hash[:2] / file_hash
+            target.parent.mkdir(exist_ok=True)
+            if not target.exists():
+                os.replace(spool_path, target)
+            stored_path = str(target)
+    except ValueError as e:
+        return None, size, None, None, str(e)
+    finally:
+        # Whatever happened (bad body, disk full, dropped connection), don't leave the spool behind
+        if spool:
+            spool.close()
+            spool_path.unlink(missing_ok=True)
+
+    return file_hash, size, stored_path, chunks, None
+
 # ============================================================================
 # PROOF CERTIFICATES
 # ============================================================================
 
-def generate_certificate(content_uuid):
-    """Generate proof certificate for content."""
-    content = get_content(content_uuid)
-    if not content:
-        return None
+# Content rows never change after registration, so a certificate is rendered
+# once (at registration, or on first request for older rows), stored in the
+# certificates table, and served as immutable bytes with an ETag.
 
-    cert = f"""
+_certificate_cache = OrderedDict()  # (uuid, format) -> (body, etag)
+_certificate_lock = threading.Lock()
+
+def render_certificate(content, generated_at):
+    """Text proof certificate for a content row."""
+    return f"""
 CONTENT REGISTRATION CERTIFICATE
 =================================
 
@@ -282,17 +746,11 @@ This certificate proves registration of the above content.
 Verify at: http://localhost:5051/verify?uuid={content['uuid']}
 
 Death2Data Content Registry v{CONFIG['version']}
-Generated: {datetime.now().isoformat()}
+Generated: {generated_at}
 """.strip()
 
-    return cert
-
-def generate_certificate_json(content_uuid):
-    """Generate JSON proof certificate."""
-    content = get_content(content_uuid)
-    if not content:
-        return None
-
+def render_certificate_json(content, generated_at):
+    """JSON proof certificate for a content row."""
     return json.dumps({
         "uuid": content["uuid"],
         "sha256": content["file_hash"],
@@ -303,15 +761,122 @@ def generate_certificate_json(content_uuid):
         "license": content["license"],
         "tags": content.get("tags", "").split(",") if content.get("tags") else [],
         "notes": content.get("notes", ""),
+        "merkle_root": content.get("merkle_root"),
         "verify_url": f"http://localhost:5051/verify?uuid={content['uuid']}",
         "registry": "Death2Data Content Registry",
         "version": CONFIG["version"]
     }, indent=2)
 
+CERTIFICATE_FORMATS = {"txt": render_certificate, "json": render_certificate_json}
+
+def store_certificates(content_uuid):
+    """Render every certificate format for a UUID and persist them."""
+    content = get_content(content_uuid)
+    if not content:
+        return False
+
+    generated_at = datetime.now().isoformat()
+    conn = get_db()
+    for fmt, render in CERTIFICATE_FORMATS.items():
+        body = render(content, generated_at).encode()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        # OR IGNORE: the first rendering wins, so Generated: never changes
+        conn.execute(
+            "INSERT OR IGNORE INTO certificates (uuid, format, body, etag) VALUES (?, ?, ?, ?)",
+            (content_uuid, fmt, body, etag)
+        )
+    conn.commit()
+    conn.close()
+    return True
+
+def get_certificate(content_uuid, fmt="txt"):
+    """Return (body_bytes, etag) for a certificate, or (None, None)."""
+    key = (content_uuid, fmt)
+    with _certificate_lock:
+        if key in _certificate_cache:
+            _certificate_cache.move_to_end(key)
+            return _certificate_cache[key]
+
+    for _ in range(2):
+        conn = get_db()
+        row = conn.execute(
+            "SELECT body, etag FROM certificates WHERE uuid = ? AND format = ?", key
+        ).fetchone()
+        conn.close()
+        if row or not store_certificates(content_uuid):
+            break
+
+    if not row:
+        return None, None
+
+    with _certificate_lock:
+        _certificate_cache[key] = (row["body"], row["etag"])
+        while len(_certificate_cache) > CONFIG["certificate_cache_size"]:
+            _certificate_cache.popitem(last=False)
+    return row["body"], row["etag"]
+
+def generate_certificate(content_uuid):
+    """Generate proof certificate for content."""
+    body, _ = get_certificate(content_uuid, "txt")
+    return body.decode() if body else None
+
+def generate_certificate_json(content_uuid):
+    """Generate JSON proof certificate."""
+    body, _ = get_certificate(content_uuid, "json")
+    return body.decode() if body else None
+
 # ============================================================================
 # FILE WATCHING
 # ============================================================================
 
+class ProcessedFiles:
+    """Files the watcher has handled, keyed by path + size + mtime.
+
+    A bounded LRU sits in front of the watched_files table, so memory stays
+    flat for long-running watchers and restarts don't re-hash old files.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or CONFIG["watch_cache_size"]
+        self.recent = OrderedDict()  # filepath -> (filesize, mtime)
+
+    def _remember(self, filepath, key):
+        self.recent[filepath] = key
+        self.recent.move_to_end(filepath)
+        while len(self.recent) > self.size:
+            self.recent.popitem(last=False)
+
+    def seen(self, filepath, stat):
+        """True if this exact version of the file was already processed."""
+        key = (stat.st_size, stat.st_mtime)
+        if self.recent.get(filepath) == key:
+            self.recent.move_to_end(filepath)
+            return True
+
+        conn = get_db()
+        row = conn.execute(
+            "SELECT filesize, mtime FROM watched_files WHERE filepath = ?", (filepath,)
+        ).fetchone()
+        conn.close()
+
+        if row and (row["filesize"], row["mtime"]) == key:
+            self._remember(filepath, key)
+            return True
+        return False
+
+    def add(self, filepath, stat, file_hash):
+        conn = get_db()
+        conn.execute("""
+            INSERT INTO watched_files (filepath, filesize, mtime, file_hash)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(filepath) DO UPDATE SET
+                filesize = excluded.filesize, mtime = excluded.mtime,
+                file_hash = excluded.file_hash, processed_at = CURRENT_TIMESTAMP
+        """, (filepath, stat.st_size, stat.st_mtime, file_hash))
+        conn.commit()
+        conn.close()
+        self._remember(filepath, (stat.st_size, stat.st_mtime))
+
 def watch_downloads(user_id):
     """Watch Downloads folder and auto-register new files."""
     try:
@@ -322,22 +887,23 @@ def watch_downloads(user_id):
         sys.exit(1)
 
     watch_path = CONFIG["watch_folder"]
-    processed = set()  # Track processed files to avoid duplicates
+    processed = ProcessedFiles()  # Track processed files to avoid duplicates
 
     class RegisterHandler(FileSystemEventHandler):
         def on_created(self, event):
             if not event.is_directory:
                 filepath = event.src_path
 
-                # Skip if already processed
-                if filepath in processed:
-                    return
-
                 # Wait for file to finish writing
                 import time
                 time.sleep(2)
 
                 if Path(filepath).exists() and not Path(filepath).name.startswith("."):
+                    # Skip if already processed
+                    stat = os.stat(filepath)
+                    if processed.seen(filepath, stat):
+                        return
+
                     # Check if already registered by hash
                     file_hash = hash_file(filepath)
                     conn = get_db()
@@ -346,7 +912,7 @@ def watch_downloads(user_id):
 
                     if existing:
                         print(f"⏭  Already registered: {Path(filepath).name} (UUID: {existing['uuid']})")
-                        processed.add(filepath)
+                        processed.add(filepath, stat, file_hash)
                         return
 
                     print(f"📁 New file detected: {Path(filepath).name}")
@@ -354,7 +920,7 @@ def watch_downloads(user_id):
 
                     if content_uuid:
                         print(f"   ✓ Registered: {content_uuid}")
-                        processed.add(filepath)
+                        processed.add(filepath, stat, file_hash)
                     else:
                         print(f"   ✗ Failed: {error}")
 
@@ -407,6 +973,32 @@ th{background:#111}
 """.strip()
 
 class RequestHandler(BaseHTTPRequestHandler):
+    # Each request gets a thread; the socket timeout drops clients that stop sending
+    timeout = CONFIG["request_timeout"]
+    ip_limit = RateLimiter(*CONFIG["rate_limit"])
+    token_limit = RateLimiter(*CONFIG["token_rate_limit"])
+    write_limit = RateLimiter(*CONFIG["write_rate_limit"])
+
+    def rate_limited(self):
+        """Send 429 and return True if this request is over any of its buckets"""
+        ip, token = client_ip(self, CONFIG["trusted_proxy"]), self.headers.get("X-Token")
+        checks = [(self.ip_limit, ip)]
+        if token:
+            checks.append((self.token_limit, token))
+        if self.command == "POST":
+            checks.append((self.write_limit, ip))
+        for limiter, key in checks:
+            ok, retry_after = limiter.allow(key)
+            if not ok:
+                self.send_response(429)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Retry-After", str(int(retry_after) + 1))
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                self.wfile.write(b"Too many requests")
+                return True
+        return False
+
     def send_html(self, content, code=200):
         html = f"""<!DOCTYPE html>
 <html><head>
@@ -439,6 +1031,8 @@ class RequestHandler(BaseHTTPRequestHandler):
         self.wfile.write(text.encode())
 
     def do_GET(self):
+        if self.rate_limited():
+            return
         parsed = urlparse(self.path)
         path = parsed.path
         query = parse_qs(parsed.query)
@@ -461,10 +1055,14 @@ class RequestHandler(BaseHTTPRequestHandler):
 GET  /                    - This page
 GET  /register            - Registration form
 POST /register            - Register content
+POST /upload?filename=x   - Stream a file body, hash it while receiving
 GET  /content/:uuid       - Lookup content
 GET  /certificate/:uuid   - Download certificate
 GET  /verify?uuid=xxx     - Verify content
+POST /verify/batch        - Rehash many (uuid, path) pairs, NDJSON results
 GET  /my-content          - List my content
+GET  /api/content         - JSON listing (license, tag, since, until,
+                            min_size, max_size, cursor, limit)
 </pre>
 """
             self.send_html(content)
@@ -507,6 +1105,7 @@ GET  /my-content          - List my content
   <tr><th>SHA256</th><td style="word-break:break-all">{content['file_hash']}</td></tr>
   <tr><th>Filename</th><td>{content['filename']}</td></tr>
   <tr><th>Size</th><td>{content['filesize']} bytes</td></tr>
+  <tr><th>Merkle root</th><td style="word-break:break-all">{content.get('merkle_root') or '-'}</td></tr>
   <tr><th>Owner</th><td>{content['owner_email']}</td></tr>
   <tr><th>License</th><td>{content['license']}</td></tr>
   <tr><th>Tags</th><td>{content.get('tags', '')}</td></tr>
@@ -526,18 +1125,30 @@ GET  /my-content          - List my content
             content_uuid = path.split("/")[-1]
             fmt = query.get("format", ["txt"])[0]
 
-            if fmt == "json":
-                cert = generate_certificate_json(content_uuid)
-                if cert:
-                    self.send_text(cert)
-                else:
+            body, etag = get_certificate(content_uuid, "json" if fmt == "json" else "txt")
+
+            if not body:
+                if fmt == "json":
                     self.send_json({"error": "UUID not found"}, 404)
-            else:
-                cert = generate_certificate(content_uuid)
-                if cert:
-                    self.send_text(cert)
                 else:
                     self.send_text("UUID not found", 404)
+            elif self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+            else:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+                self.end_headers()
+                self.wfile.write(body)
+
+        # JSON listing
+        elif path == "/api/content":
+            self.handle_list(query)
 
         # Verify
         elif path == "/verify":
@@ -586,6 +1197,16 @@ GET  /my-content          - List my content
             self.send_html("<h1>404</h1><p>Not found</p>", 404)
 
     def do_POST(self):
+        if self.rate_limited():
+            return
+        parsed = urlparse(self.path)
+
+        if parsed.path == "/upload":
+            return self.handle_upload(parse_qs(parsed.query))
+
+        if parsed.path == "/verify/batch":
+            return self.handle_verify_batch()
+
         if self.path == "/register":
             length = int(self.headers.get("Content-Length", 0))
             body = self.rfile.read(length).decode()
@@ -625,6 +1246,119 @@ GET  /my-content          - List my content
             else:
                 self.send_html(f'<div class="error">Error: {error}</div>', 400)
 
+    def handle_list(self, query):
+        """GET /api/content - filtered, cursor-paginated listing of the caller's content."""
+        # Header only: tokens in query strings end up in access logs and Referers
+        user = get_user(self.headers.get("X-Token", ""))
+        if not user:
+            return self.send_json({"error": "Invalid token"}, 401)
+
+        arg = lambda name: query.get(name, [None])[0]
+        try:
+            rows, next_cursor = list_content(
+                user["id"],
+                license=arg("license"),
+                tag=arg("tag"),
+                since=arg("since"),
+                until=arg("until"),
+                min_size=arg("min_size"),
+                max_size=arg("max_size"),
+                cursor=arg("cursor"),
+                limit=arg("limit") or 100,
+            )
+        except (ValueError, TypeError):
+            return self.send_json({"error": "Invalid filter or cursor"}, 400)
+
+        for row in rows:
+            row["tags"] = parse_tags(row["tags"])
+            del row["id"]
+        self.send_json({"items": rows, "next_cursor": next_cursor})
+
+    def handle_upload(self, query):
+        """POST /upload - raw body (Content-Length or chunked), metadata in the query."""
+        self.close_connection = True  # unread body must not be parsed as a request
+
+        user = get_user(self.headers.get("X-Token", ""))
+        if not user:
+            return self.send_json({"error": "Invalid token"}, 401)
+
+        if self.headers.get("Content-Type", "").startswith("multipart/"):
+            return self.send_json({"error": "Send the file as the raw request body (curl -T file)"}, 415)
+
+        conn = get_db()
+        error = check_quota(conn, user["id"])
+        conn.close()
+        if error:
+            return self.send_json({"error": error}, 403)
+
+        chunked = "chunked" in self.headers.get("Transfer-Encoding", "").lower()
+        length = None
+        if not chunked:
+            length = self.headers.get("Content-Length", "0").strip()
+            if not length.isdigit():
+                return self.send_json({"error": "Invalid Content-Length"}, 400)
+            length = int(length)
+            if not length:
+                return self.send_json({"error": "Empty upload"}, 400)
+
+        store = query.get("store", ["0"])[0] in ("1", "true", "yes")
+        try:
+            file_hash, filesize, stored_path, chunks, error = receive_upload(self.rfile, length, chunked, store)
+        except TimeoutError:
+            return self.send_json({"error": "Upload stalled"}, 408)
+        if error:
+            code = 413 if error.startswith("Upload too large") else 400
+            return self.send_json({"error": error}, code)
+
+        filename = Path(query.get("filename", ["upload"])[0]).name or "upload"
+        content_uuid, error = save_content(
+            file_hash, filename, stored_path or "", filesize, user["id"],
+            query.get("license", ["Proprietary"])[0],
+            query.get("tags", [""])[0],
+            query.get("notes", [""])[0],
+            chunks=chunks,
+        )
+        if not content_uuid:
+            return self.send_json({"error": error}, 400)
+
+        self.send_json({
+            "uuid": content_uuid,
+            "sha256": file_hash,
+            "filesize": filesize,
+            "stored": bool(stored_path),
+            "merkle_root": merkle_root(chunks) if chunks else None,
+            "certificate": f"/certificate/{content_uuid}?format=json",
+        }, 201)
+
+    def handle_verify_batch(self):
+        """POST /verify/batch - manifest in, one NDJSON line per item plus a summary out."""
+        length = self.headers.get("Content-Length", "0").strip()
+        if not length.isdigit():
+            return self.send_json({"error": "Invalid Content-Length"}, 400)
+        body = self.rfile.read(int(length)).decode()
+
+        if not get_user(self.headers.get("X-Token", "")):
+            return self.send_json({"error": "Invalid token"}, 401)
+
+        try:
+            items = parse_manifest(body)
+        except (ValueError, KeyError, IndexError, TypeError):
+            return self.send_json({"error": "Invalid manifest"}, 400)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+
+        summary = {"total": 0, "ok": 0, "failed": 0}
+        # Over HTTP only files under the registry's own folders may be read
+        for result in verify_batch(items, roots=verify_roots()):
+            summary["total"] += 1
+            summary["ok" if result["ok"] else "failed"] += 1
+            self.wfile.write((json.dumps(result) + "\n").encode())
+            self.wfile.flush()
+        self.wfile.write((json.dumps({"summary": summary}) + "\n").encode())
+
     def log_message(self, format, *args):
         # Suppress default logging
         pass
@@ -633,9 +1367,38 @@ GET  /my-content          - List my content
 # CLI
 # ============================================================================
 
+def verify_manifest_cli(manifest_path):
+    """Verify every entry in a manifest file and print a summary."""
+    items = parse_manifest(Path(manifest_path).read_text())
+    ok = failed = 0
+
+    for result in verify_batch(items):
+        if result["ok"]:
+            ok += 1
+            print(f"✓ {result['uuid']}  {result['path']}")
+        else:
+            failed += 1
+            print(f"✗ {result['uuid']}  {result['path']}  ({result['message']})")
+
+    print(f"\n{ok + failed} checked · {ok} ok · {failed} failed")
+    return failed == 0
+
 def main():
     init_db()
 
+    if "--verify-chunks" in sys.argv:
+        i = sys.argv.index("--verify-chunks")
+        sample = int(sys.argv[sys.argv.index("--sample") + 1]) if "--sample" in sys.argv else None
+        ok, message, bad = verify_chunks(sys.argv[i + 1], sys.argv[i + 2], sample=sample)
+        print(f"{'✓' if ok else '✗'} {message}")
+        for start, end in bad:
+            print(f"   modified bytes {start}-{end}")
+        sys.exit(0 if ok else 1)
+
+    if "--verify-batch" in sys.argv:
+        manifest = sys.argv[sys.argv.index("--verify-batch") + 1]
+        sys.exit(0 if verify_manifest_cli(manifest) else 1)
+
     if "--watch" in sys.argv:
         # Demo user for watch mode (in production, require signup)
         conn = get_db()
@@ -656,7 +1419,7 @@ def main():
         print(f"   Database: {DB}\n")
         print("   Press Ctrl+C to stop\n")
 
-        server = HTTPServer(("0.0.0.0", PORT), RequestHandler)
+        server = ThreadingHTTPServer(("0.0.0.0", PORT), RequestHandler)
         try:
             server.serve_forever()
         except KeyboardInterrupt:
@@ -20,20 +20,50 @@ Open:
     http://localhost:8000
 """
 
-import sqlite3, secrets, hashlib, json, os, uuid
-from datetime import datetime
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import parse_qs, urlparse, urlencode
+import sqlite3, secrets, hashlib, hmac, json, math, os, uuid, threading, time, sys, zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse, urlencode, urlunparse
 import urllib.request
+import outbound
+from ratelimit import RateLimiter, client_ip
 
 DB = "d2d.db"
+BOOTSTRAP_VERSION = 3  # bump when init_db, CHANGELOG or SEED_PROJECTS change
 PORT = int(os.environ.get("PORT", 5052))  # Changed to 5052 to avoid conflict
 SEARXNG = ["https://searx.be", "https://search.sapti.me"]
 VERSION = "v1.3.0"
+SEARCH_INDEX_MAX_DOCS = 50000  # local fallback index size budget (oldest evicted first)
+SEARCH_INDEX_TRIM_EVERY = 100  # index writes between budget checks (each check is a full COUNT)
+SEARCH_CACHE_SIZE = 5000   # query pages kept in memory (compact Result tuples)
+SEARCH_CACHE_TTL = 300     # seconds a cached result is fresh
+SEARCH_CACHE_STALE = 3600  # seconds a cached result may be served while it refreshes
+SEARCH_MAX_PAGE = 10       # deepest SearXNG page we'll fetch or prefetch
+SEARCH_PREFETCH_MAX = 4    # concurrent next-page prefetches
+SEARCH_MERGE_WAIT = 0.5    # after the first instance answers, wait this long for the rest
+SEARCH_MERGE_DEPTH = 30    # results taken from each instance when merging
+STATS_FILE = "stats.json"  # written by mrr.py
+STATS_LIVE_TTL = 30        # seconds between recounts of the live /stats counters
+VERSION_CHECK_INTERVAL = 1.0  # seconds between checks of a cache's meta version
+USER_STARS_CACHE_SIZE = 10000 # users whose starred sets are kept in memory
+TREND_HALF_LIFE = 3 * 86400   # a star's weight in the trending score halves every 3 days
+USAGE_RETENTION_DAYS = 90     # daily usage rows older than this are rolled into usage_monthly
+RETENTION_INTERVAL = 6 * 3600 # seconds between retention runs
+API_RATE = 1                  # /api/search requests per second per token, sustained
+API_BURST = 30                # ...and how many may arrive at once
+API_FIELDS = ('title', 'url', 'host', 'snippet')
+IP_RATE, IP_BURST = 20, 100     # every request, per client IP
+TOKEN_RATE, TOKEN_BURST = 5, 50 # requests carrying a token cookie, per token
+AUTH_RATE, AUTH_BURST = 0.2, 5  # POST /signup and /login, per client IP
+TRUSTED_PROXY = os.environ.get("TRUSTED_PROXY", "cloudflare") or None  # see ratelimit.client_ip; "" trusts no headers
 
 # Stripe config
 STRIPE_KEY = os.environ.get("STRIPE_SECRET_KEY", "")
 STRIPE_PRICE_ID = os.environ.get("STRIPE_PRICE_ID", "")
+STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET", "")
+STRIPE_API = os.environ.get("STRIPE_API", "https://api.stripe.com")  # point at a local stub for testing
 DOMAIN = os.environ.get("DOMAIN", f"http://localhost:{PORT}")
 
 # Tier limits (searches/day, saves/month)
@@ -99,6 +129,14 @@ def init_db():
             enabled INTEGER DEFAULT 1,
             UNIQUE(feature_name, cohort)
         );
+        CREATE TABLE IF NOT EXISTS feature_rollouts (
+            feature_name TEXT PRIMARY KEY,
+            percent INTEGER NOT NULL CHECK (percent BETWEEN 0 AND 100)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
         CREATE TABLE IF NOT EXISTS projects (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -119,15 +157,170 @@ def init_db():
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
             FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
         );
+        CREATE TABLE IF NOT EXISTS checkout_sessions (
+            session_id TEXT PRIMARY KEY,
+            email TEXT,
+            customer_id TEXT,
+            status TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS stripe_events (
+            id TEXT PRIMARY KEY,
+            type TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS api_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token_hash TEXT UNIQUE NOT NULL,
+            prefix TEXT NOT NULL,
+            scope TEXT NOT NULL DEFAULT 'search',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+        CREATE INDEX IF NOT EXISTS idx_api_tokens_user ON api_tokens(user_id);
     """)
+    # Columns added since the first release; older databases get them here
+    users = {r[1] for r in conn.execute("PRAGMA table_info(users)")}
+    if 'stripe_customer_id' not in users:
+        conn.execute("ALTER TABLE users ADD COLUMN stripe_customer_id TEXT")
+    if 'cohort' not in users:
+        conn.execute("ALTER TABLE users ADD COLUMN cohort TEXT DEFAULT 'A'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_stripe_customer ON users(stripe_customer_id)")
+    if 'trend_log' not in {r[1] for r in conn.execute("PRAGMA table_info(projects)")}:
+        conn.execute("ALTER TABLE projects ADD COLUMN trend_log REAL")
+        backfill_trending(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_projects_trending ON projects(status, trend_log DESC, stars DESC)")
+
+    # Full-text search over saved results and registered content
+    has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'saved_fts'").fetchone()
+    conn.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS saved_fts USING fts5(
+            title, url, snippet, content='saved', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS saved_fts_ai AFTER INSERT ON saved BEGIN
+            INSERT INTO saved_fts(rowid, title, url, snippet) VALUES (new.id, new.title, new.url, new.snippet);
+        END;
+        CREATE TRIGGER IF NOT EXISTS saved_fts_ad AFTER DELETE ON saved BEGIN
+            INSERT INTO saved_fts(saved_fts, rowid, title, url, snippet) VALUES ('delete', old.id, old.title, old.url, old.snippet);
+        END;
+        CREATE TRIGGER IF NOT EXISTS saved_fts_au AFTER UPDATE ON saved BEGIN
+            INSERT INTO saved_fts(saved_fts, rowid, title, url, snippet) VALUES ('delete', old.id, old.title, old.url, old.snippet);
+            INSERT INTO saved_fts(rowid, title, url, snippet) VALUES (new.id, new.title, new.url, new.snippet);
+        END;
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
+            title, description, content='content', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS content_fts_ai AFTER INSERT ON content BEGIN
+            INSERT INTO content_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS content_fts_ad AFTER DELETE ON content BEGIN
+            INSERT INTO content_fts(content_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS content_fts_au AFTER UPDATE ON content BEGIN
+            INSERT INTO content_fts(content_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO content_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END;
+
+        CREATE TABLE IF NOT EXISTS search_docs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT UNIQUE NOT NULL,
+            title TEXT, snippet TEXT,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_search_docs_seen ON search_docs(last_seen);
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_docs_fts USING fts5(
+            title, url, snippet, content='search_docs', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS search_docs_fts_ai AFTER INSERT ON search_docs BEGIN
+            INSERT INTO search_docs_fts(rowid, title, url, snippet) VALUES (new.id, new.title, new.url, new.snippet);
+        END;
+        CREATE TRIGGER IF NOT EXISTS search_docs_fts_ad AFTER DELETE ON search_docs BEGIN
+            INSERT INTO search_docs_fts(search_docs_fts, rowid, title, url, snippet) VALUES ('delete', old.id, old.title, old.url, old.snippet);
+        END;
+        CREATE TRIGGER IF NOT EXISTS search_docs_fts_au AFTER UPDATE OF title, url, snippet ON search_docs BEGIN
+            INSERT INTO search_docs_fts(search_docs_fts, rowid, title, url, snippet) VALUES ('delete', old.id, old.title, old.url, old.snippet);
+            INSERT INTO search_docs_fts(rowid, title, url, snippet) VALUES (new.id, new.title, new.url, new.snippet);
+        END;
+
+        CREATE TABLE IF NOT EXISTS search_cache (
+            query TEXT NOT NULL,
+            page INTEGER NOT NULL,
+            fetched_at REAL NOT NULL,
+            results BLOB NOT NULL,
+            PRIMARY KEY (query, page)
+        );
+        CREATE INDEX IF NOT EXISTS idx_search_cache_fetched ON search_cache(fetched_at);
+
+        CREATE INDEX IF NOT EXISTS idx_saved_user ON saved(user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_content_user ON content(user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_projects_rank ON projects(status, score DESC, stars DESC);
+
+        CREATE TABLE IF NOT EXISTS usage_monthly (
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            month TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, action, month),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_usage_date ON usage(date);
+        CREATE INDEX IF NOT EXISTS idx_project_stars_user ON project_stars(user_id);
+    """)
+    if not has_fts:
+        # Index rows saved before the FTS tables existed
+        conn.execute("INSERT INTO saved_fts(saved_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO content_fts(content_fts) VALUES ('rebuild')")
     conn.commit()
     conn.close()
 
 def db():
     conn = sqlite3.connect(DB)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")  # off by default; the ON DELETE CASCADEs depend on it
     return conn
 
+CHANGELOG = [
+    ("v1.0.0", "Auth, Search, Save, Content Registry, Export", "Privacy-first search with ownership tracking"),
+    ("v1.1.0", "Added CSV export, improved UI", "Save 5-10 min/week with faster exports"),
+    ("v1.2.0", "Usage tracking, tier limits, changelog, A/B testing", "Track value delivered: X searches, Y saves per day. Data-driven pricing."),
+    ("v1.3.0", "Stripe payment integration + Golden Ticket discovery", "One-click payment → instant access. Members get 1000 searches/day. Discover projects early."),
+]
+
+SEED_PROJECTS = [
+    ("Death2Data", "https://github.com/deathtodata/death2data", "Privacy-first search engine with content ownership tracking", "search", 85),
+    ("Fortune 0", "https://fortune0.com", "Contribution tracking and equity distribution for open source", "tools", 75),
+    ("Ollama", "https://ollama.com", "Run LLMs locally with zero cloud dependency", "ai", 95),
+    ("SearXNG", "https://github.com/searxng/searxng", "Privacy-respecting metasearch engine", "search", 90),
+]
+
+def bootstrap():
+    """Schema, changelog and seed projects, skipped once the DB is stamped with BOOTSTRAP_VERSION.
+
+    A warm start is a single PRAGMA read. Returns True if bootstrap ran.
+    """
+    conn = db()
+    stamped = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.close()
+    if stamped >= BOOTSTRAP_VERSION:
+        return False
+
+    init_db()
+    conn = db()
+    conn.executemany("INSERT OR IGNORE INTO versions (version, features, value_impact) VALUES (?, ?, ?)", CHANGELOG)
+    if not conn.execute("SELECT 1 FROM projects LIMIT 1").fetchone():
+        conn.executemany("INSERT INTO projects (name, url, description, category, score) VALUES (?, ?, ?, ?, ?)",
+                        SEED_PROJECTS)
+    conn.execute(f"PRAGMA user_version = {BOOTSTRAP_VERSION}")
+    conn.commit()
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        # Lets the retention job hand freed pages back; takes effect on the VACUUM
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    conn.close()
+    return True
+
 # ============================================================================
 # USAGE TRACKING
 # ============================================================================
@@ -193,16 +386,77 @@ def add_version(version, features, value_impact):
     conn.close()
 
 # ============================================================================
-# A/B TESTING
+# CACHE VERSIONS
 # ============================================================================
+# In-memory caches (flags, Discover) are tagged with a counter in the meta
+# table. Writers bump it in the same transaction; readers compare at most once
+# per VERSION_CHECK_INTERVAL, so every worker process catches up within about
+# a second and the writing process immediately.
 
-def is_feature_enabled(feature_name, cohort):
-    """Check if feature is enabled for user's cohort"""
+_versions = {}  # key -> (value, checked_at)
+
+def meta_version(key):
+    value, checked_at = _versions.get(key, (None, 0))
+    if time.time() - checked_at < VERSION_CHECK_INTERVAL:
+        return value
     conn = db()
-    row = conn.execute("SELECT enabled FROM feature_flags WHERE feature_name = ? AND cohort = ?",
-                      (feature_name, cohort)).fetchone()
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
     conn.close()
-    return bool(row['enabled']) if row else True  # Default enabled
+    value = row['value'] if row else 0
+    _versions[key] = (value, time.time())
+    return value
+
+def bump_version(conn, key):
+    """Bump a cache version inside the caller's transaction"""
+    conn.execute("""
+        INSERT INTO meta (key, value) VALUES (?, 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1
+    """, (key,))
+    _versions.pop(key, None)  # recheck on next read, after the caller commits
+
+# ============================================================================
+# A/B TESTING
+# ============================================================================
+
+# Flags live in memory, reloaded when the flags_version counter moves.
+
+_flags = {"version": None, "cohorts": {}, "rollouts": {}}
+_flags_lock = threading.Lock()
+
+def current_flags():
+    global _flags
+    version = meta_version('flags_version')
+    if version == _flags["version"]:
+        return _flags
+
+    with _flags_lock:
+        if version != _flags["version"]:
+            conn = db()
+            _flags = {
+                "version": version,
+                "cohorts": {(r['feature_name'], r['cohort']): bool(r['enabled'])
+                            for r in conn.execute("SELECT feature_name, cohort, enabled FROM feature_flags")},
+                "rollouts": {r['feature_name']: r['percent']
+                             for r in conn.execute("SELECT feature_name, percent FROM feature_rollouts")},
+            }
+            conn.close()
+        return _flags
+
+def rollout_bucket(feature_name, user_id):
+    """Stable 0-99 bucket; hashed with the feature name so each rollout picks different users"""
+    return int(hashlib.sha256(f"{feature_name}:{user_id}".encode()).hexdigest()[:8], 16) % 100
+
+def is_feature_enabled(feature_name, cohort, user_id=None):
+    """Check if feature is enabled for user's cohort (and rollout bucket, if one is set)"""
+    flags = current_flags()
+    if not flags["cohorts"].get((feature_name, cohort), True):  # Default enabled
+        return False
+    percent = flags["rollouts"].get(feature_name)
+    if percent is None:
+        return True
+    if user_id is None:
+        return percent >= 100
+    return rollout_bucket(feature_name, user_id) < percent
 
 def set_feature_flag(feature_name, cohort, enabled):
     """Enable/disable feature for specific cohort"""
@@ -213,6 +467,19 @@ def set_feature_flag(feature_name, cohort, enabled):
     except sqlite3.IntegrityError:
         conn.execute("UPDATE feature_flags SET enabled = ? WHERE feature_name = ? AND cohort = ?",
                     (enabled, feature_name, cohort))
+    bump_version(conn, 'flags_version')
+    conn.commit()
+    conn.close()
+
+def set_feature_rollout(feature_name, percent):
+    """Roll a feature out to `percent` of users (by user_id bucket); None removes the rollout"""
+    conn = db()
+    if percent is None:
+        conn.execute("DELETE FROM feature_rollouts WHERE feature_name = ?", (feature_name,))
+    else:
+        conn.execute("INSERT OR REPLACE INTO feature_rollouts (feature_name, percent) VALUES (?, ?)",
+                    (feature_name, max(0, min(100, int(percent)))))
+    bump_version(conn, 'flags_version')
     conn.commit()
     conn.close()
 
@@ -220,39 +487,127 @@ def set_feature_flag(feature_name, cohort, enabled):
 # GOLDEN TICKET (PROJECT DISCOVERY)
 # ============================================================================
 
-def get_projects():
-    """Get all active projects"""
-    conn = db()
-    rows = conn.execute("SELECT * FROM projects WHERE status='active' ORDER BY score DESC, stars DESC").fetchall()
-    conn.close()
-    return [dict(r) for r in rows]
+# Trending is a sum over stars of 2^(-age / TREND_HALF_LIFE). Stored as
+# trend_log = ln(sum(e^(starred_at / tau))) it never needs decaying: every
+# project shares the same "now" term, so ordering by trend_log is ordering by
+# the decayed score, and each new star is a single log-add.
+
+TREND_TAU = TREND_HALF_LIFE / math.log(2)
+
+def trend_add(trend_log, starred_at):
+    """trend_log after one more star at unix time starred_at"""
+    x = starred_at / TREND_TAU
+    if trend_log is None:
+        return x
+    hi, lo = max(trend_log, x), min(trend_log, x)
+    return hi + math.log1p(math.exp(lo - hi))
+
+def backfill_trending(conn, project_ids=None):
+    """Compute trend_log from project_stars, for every project or just project_ids"""
+    if project_ids is None:
+        rows = conn.execute("SELECT project_id, created_at FROM project_stars ORDER BY created_at").fetchall()
+    else:
+        marks = ",".join("?" * len(project_ids))
+        conn.execute(f"UPDATE projects SET trend_log = NULL WHERE id IN ({marks})", project_ids)
+        rows = conn.execute(f"SELECT project_id, created_at FROM project_stars WHERE project_id IN ({marks}) ORDER BY created_at",
+                           project_ids).fetchall()
+    logs = {}
+    for r in rows:
+        starred_at = datetime.strptime(r[1], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+        logs[r[0]] = trend_add(logs.get(r[0]), starred_at)
+    conn.executemany("UPDATE projects SET trend_log = ? WHERE id = ?", [(v, k) for k, v in logs.items()])
+
+# The ranked lists and per-user starred sets are cached in memory. Any write
+# to projects or stars bumps projects_version, which drops the lists; each
+# user's starred set has its own stars_version:<user_id> counter, so a star
+# only drops the starring user's set.
+
+PROJECT_SORTS = {
+    'top': "score DESC, stars DESC",
+    'trending': "trend_log DESC, stars DESC",  # NULLs (never starred) sort last
+}
+
+_projects = {}  # sort -> {"version", "rows", "cards"}
+_user_stars = OrderedDict()  # user_id -> (stars_version, checked_at, frozenset of project ids)
+_projects_lock = threading.Lock()
+
+def get_projects(sort='top'):
+    """Get all active projects, ranked by score ('top') or recent stars ('trending')"""
+    version = meta_version('projects_version')
+    cached = _projects.get(sort)
+    if not cached or cached["version"] != version:
+        conn = db()
+        rows = conn.execute(f"SELECT * FROM projects WHERE status='active' ORDER BY {PROJECT_SORTS[sort]}").fetchall()
+        conn.close()
+        cached = _projects[sort] = {"version": version, "rows": [dict(r) for r in rows]}
+    return cached["rows"]
 
 def add_project(name, url, description, category, score=50):
     """Add a new project"""
     conn = db()
     conn.execute("INSERT INTO projects (name, url, description, category, score) VALUES (?, ?, ?, ?, ?)",
                 (name, url, description, category, score))
+    bump_version(conn, 'projects_version')
     conn.commit()
     conn.close()
 
 def star_project(user_id, project_id):
-    """User stars a project"""
+    """User stars a project; returns False if they already had"""
     conn = db()
+    # IMMEDIATE takes the write lock up front so the check and the count move together
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        conn.execute("INSERT INTO project_stars (user_id, project_id) VALUES (?, ?)",
-                    (user_id, project_id))
-        conn.execute("UPDATE projects SET stars = stars + 1 WHERE id = ?", (project_id,))
+        row = conn.execute("SELECT trend_log FROM projects WHERE id = ?", (project_id,)).fetchone()
+        starred = row and conn.execute("INSERT OR IGNORE INTO project_stars (user_id, project_id) VALUES (?, ?)",
+                                      (user_id, project_id)).rowcount
+        if starred:
+            conn.execute("UPDATE projects SET stars = stars + 1, trend_log = ? WHERE id = ?",
+                        (trend_add(row['trend_log'], time.time()), project_id))
+            bump_version(conn, 'projects_version')
+            bump_version(conn, stars_key(user_id))
         conn.commit()
-    except sqlite3.IntegrityError:
-        pass  # Already starred
-    conn.close()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if starred:
+        forget_user_stars(user_id)
+    return bool(starred)
+
+def stars_key(user_id):
+    return f"stars_version:{user_id}"
+
+def forget_user_stars(user_id):
+    with _projects_lock:
+        _user_stars.pop(user_id, None)
 
 def get_user_stars(user_id):
     """Get project IDs user has starred"""
+    now = time.time()
+    with _projects_lock:
+        cached = _user_stars.get(user_id)
+        if cached and now - cached[1] < VERSION_CHECK_INTERVAL:
+            _user_stars.move_to_end(user_id)
+            return cached[2]
+
+    # Read the version before the set: a star in between only costs a refetch
     conn = db()
-    rows = conn.execute("SELECT project_id FROM project_stars WHERE user_id = ?", (user_id,)).fetchall()
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (stars_key(user_id),)).fetchone()
+    version = row['value'] if row else 0
+    if cached and cached[0] == version:
+        stars = cached[2]
+    else:
+        rows = conn.execute("SELECT project_id FROM project_stars WHERE user_id = ?", (user_id,)).fetchall()
+        stars = frozenset(r['project_id'] for r in rows)
     conn.close()
-    return {r['project_id'] for r in rows}
+
+    with _projects_lock:
+        _user_stars[user_id] = (version, now, stars)
+        _user_stars.move_to_end(user_id)
+        while len(_user_stars) > USER_STARS_CACHE_SIZE:
+            _user_stars.popitem(last=False)
+    return stars
 
 # ============================================================================
 # AUTH
@@ -284,6 +639,48 @@ def login(token):
     conn.close()
     return dict(user) if user else None
 
+# API tokens are for embedding in public pages (the search widget). They are
+# separate from the login token, limited to one scope, and revoked by deleting
+# the row; login() never accepts them.
+
+API_SCOPES = ('search',)
+
+def create_api_token(user_id, scope='search'):
+    """Issue an API token; only its hash is kept, so it's shown once"""
+    if scope not in API_SCOPES:
+        raise ValueError(f"unknown scope {scope!r}")
+    token = "d2d_" + secrets.token_hex(24)
+    conn = db()
+    conn.execute("INSERT INTO api_tokens (user_id, token_hash, prefix, scope) VALUES (?, ?, ?, ?)",
+                (user_id, hashlib.sha256(token.encode()).hexdigest(), token[:10], scope))
+    conn.commit()
+    conn.close()
+    return token
+
+def get_api_tokens(user_id):
+    conn = db()
+    rows = conn.execute("SELECT id, prefix, scope, created_at FROM api_tokens WHERE user_id = ? ORDER BY id",
+                       (user_id,)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def revoke_api_token(user_id, token_id):
+    conn = db()
+    conn.execute("DELETE FROM api_tokens WHERE id = ? AND user_id = ?", (token_id, user_id))
+    conn.commit()
+    conn.close()
+
+def api_login(token, scope):
+    """The user behind an API token carrying `scope`, or None"""
+    if not token: return None
+    conn = db()
+    user = conn.execute("""
+        SELECT users.* FROM api_tokens JOIN users ON users.id = api_tokens.user_id
+        WHERE api_tokens.token_hash = ? AND api_tokens.scope = ?
+    """, (hashlib.sha256(token.encode()).hexdigest(), scope)).fetchone()
+    conn.close()
+    return dict(user) if user else None
+
 # ============================================================================
 # STRIPE
 # ============================================================================
@@ -305,21 +702,24 @@ def create_checkout_session():
     body = "&".join(f"{k}={v}" for k, v in data.items())
 
     req = urllib.request.Request(
-        "https://api.stripe.com/v1/checkout/sessions",
+        f"{STRIPE_API}/v1/checkout/sessions",
         data=body.encode(),
         headers={
             "Authorization": f"Bearer {STRIPE_KEY}",
             "Content-Type": "application/x-www-form-urlencoded",
+            # Makes the retry safe: Stripe returns the same session for a repeated key
+            "Idempotency-Key": secrets.token_hex(16),
         }
     )
 
     try:
-        with urllib.request.urlopen(req) as resp:
-            session = json.loads(resp.read().decode())
-            return session.get("url"), None
+        session = json.loads(outbound.request(req, timeout=15, retries=2).decode())
+        return session.get("url"), None
     except urllib.error.HTTPError as e:
         error = json.loads(e.read().decode())
         return None, error.get("error", {}).get("message", "Stripe error")
+    except (OSError, outbound.CircuitOpen):
+        return None, "Payments are temporarily unavailable. Please try again in a minute."
 
 def get_checkout_session(session_id):
     """Get details of a completed checkout"""
@@ -327,22 +727,299 @@ def get_checkout_session(session_id):
         return None
 
     req = urllib.request.Request(
-        f"https://api.stripe.com/v1/checkout/sessions/{session_id}",
+        f"{STRIPE_API}/v1/checkout/sessions/{session_id}",
         headers={"Authorization": f"Bearer {STRIPE_KEY}"}
     )
 
     try:
-        with urllib.request.urlopen(req) as resp:
-            return json.loads(resp.read().decode())
-    except:
+        return json.loads(outbound.request(req, timeout=10, retries=2).decode())
+    except (OSError, ValueError, outbound.CircuitOpen):
         return None
 
+# Webhooks provision members as they arrive; /success then reads the
+# local checkout_sessions row instead of waiting on Stripe. Lookups that do
+# go to Stripe (webhook not in yet, or not configured) are stored the same way.
+
+def verify_stripe_signature(payload, header, secret, tolerance=300, now=None):
+    """Check a Stripe-Signature header (t=...,v1=...) against the raw body"""
+    parts = [p.split("=", 1) for p in (header or "").split(",") if "=" in p]
+    timestamp = next((v for k, v in parts if k == "t"), None)
+    signatures = [v for k, v in parts if k == "v1"]
+    if not secret or not timestamp or not signatures or not timestamp.isdigit():
+        return False
+    if abs((now or time.time()) - int(timestamp)) > tolerance:
+        return False
+    expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    return any(hmac.compare_digest(expected, sig) for sig in signatures)
+
+def store_checkout(conn, session):
+    """Store a checkout session and upgrade its customer if it's paid (caller commits)"""
+    email = (session.get("customer_details") or {}).get("email") or session.get("customer_email")
+    customer_id = session.get("customer")
+    paid = session.get("status") == "complete" and session.get("payment_status") in ("paid", "no_payment_required")
+
+    conn.execute("""
+        INSERT INTO checkout_sessions (session_id, email, customer_id, status) VALUES (?, ?, ?, ?)
+        ON CONFLICT(session_id) DO UPDATE SET email = excluded.email, customer_id = excluded.customer_id,
+                                              status = excluded.status, updated_at = CURRENT_TIMESTAMP
+    """, (session["id"], email, customer_id, "paid" if paid else session.get("status")))
+    if paid and email:
+        # New members get an unusable token hash; /success issues the real token
+        conn.execute("""
+            INSERT INTO users (email, token_hash, stripe_customer_id, tier) VALUES (?, ?, ?, 'member')
+            ON CONFLICT(email) DO UPDATE SET stripe_customer_id = excluded.stripe_customer_id, tier = 'member'
+        """, (email, hashlib.sha256(secrets.token_bytes(32)).hexdigest(), customer_id))
+
+def remember_checkout(session):
+    conn = db()
+    store_checkout(conn, session)
+    conn.commit()
+    conn.close()
+
+def checkout_row(session_id):
+    conn = db()
+    row = conn.execute("SELECT * FROM checkout_sessions WHERE session_id = ?", (session_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def lookup_checkout(session_id):
+    """Checkout session details, from the local table when the webhook beat us here"""
+    row = checkout_row(session_id)
+    if row and row['status'] == 'paid':
+        return row
+
+    session = get_checkout_session(session_id)
+    if not session or "id" not in session:
+        return row
+    remember_checkout(session)
+    return checkout_row(session_id)
+
+def handle_stripe_event(event):
+    """Apply one webhook event; returns False if it was already applied.
+
+    The event id is recorded in the same transaction as the writes it causes,
+    so a failure records nothing and Stripe's retry gets processed.
+    """
+    conn = db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM stripe_events WHERE id = ?", (event["id"],)).fetchone():
+            return False
+
+        obj = event.get("data", {}).get("object", {})
+        if event.get("type") in ("checkout.session.completed", "checkout.session.async_payment_succeeded"):
+            store_checkout(conn, obj)
+        elif event.get("type") == "customer.subscription.deleted" and obj.get("customer"):
+            conn.execute("UPDATE users SET tier = 'free' WHERE stripe_customer_id = ?", (obj["customer"],))
+
+        conn.execute("INSERT INTO stripe_events (id, type) VALUES (?, ?)", (event["id"], event.get("type")))
+        conn.commit()
+        return True
+    finally:
+        conn.rollback()  # no-op after commit; undoes everything if anything above raised
+        conn.close()
+
 # ============================================================================
 # SEARCH
 # ============================================================================
 
-def search(query, user_id=None, user_tier='free'):
+# All instances are queried in parallel and merged. Identical queries share
+# one upstream fetch (single-flight), and results past their TTL are served
+# immediately while a background refresh runs (stale-while-revalidate).
+
+_search_cache = OrderedDict()  # (query, page) -> (fetched_at, results)
+_search_inflight = {}          # (query, page) -> _Flight
+_search_lock = threading.Lock()
+_prefetch_slots = threading.BoundedSemaphore(SEARCH_PREFETCH_MAX)
+_upstream_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="searxng")
+
+class Result:
+    """One search hit, trimmed at ingestion to the fields the pages use"""
+    __slots__ = ('title', 'url', 'host', 'snippet', 'local')
+
+    def __init__(self, title, url, snippet='', local=False):
+        self.title = (title or '')[:300]
+        self.url = url
+        try:
+            host = urlparse(url).hostname or ''
+        except ValueError:  # e.g. an unclosed IPv6 bracket from a misbehaving instance
+            host = ''
+        self.host = sys.intern(host.lower())  # shared across results
+        self.snippet = (snippet or '')[:200]
+        self.local = local
+
+    @classmethod
+    def from_searxng(cls, r):
+        return cls(r.get('title'), r['url'], r.get('content'))
+
+def pack_results(results):
+    """Compact binary form for the persistent cache"""
+    return zlib.compress(json.dumps([(r.title, r.url, r.snippet) for r in results], separators=(',', ':')).encode())
+
+def unpack_results(blob):
+    return tuple(Result(t, u, s) for t, u, s in json.loads(zlib.decompress(blob)))
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.results = None
+
+def fetch_instance(instance, query, page=1):
+    url = f"{instance}/search?{urlencode({'q': query, 'format': 'json', 'pageno': page})}"
+    req = urllib.request.Request(url, headers={"User-Agent": "D2D/1.0"})
+    body = outbound.request(req, timeout=10)  # instances are our retries
+    return [Result.from_searxng(x) for x in json.loads(body).get("results", []) if x.get('url')]
+
+def fetch_results(query, page=1):
+    """Query every SearXNG instance at once and merge what arrives.
+
+    Waits for the first answer, then at most SEARCH_MERGE_WAIT for the
+    others. Returns None if every instance failed.
+    """
+    pending = {_upstream_pool.submit(fetch_instance, i, query, page) for i in SEARXNG}
+    lists, deadline = [], None
+    while pending:
+        timeout = None if deadline is None else max(0, deadline - time.time())
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done: break  # merge window closed; stragglers finish in the background
+        for f in done:
+            try: lists.append(f.result())
+            except Exception: continue
+            if deadline is None: deadline = time.time() + SEARCH_MERGE_WAIT
+    return merge_results(lists) if lists else None
+
+TRACKING_PARAMS = {'fbclid', 'gclid', 'ref', 'ref_src', 'mc_cid', 'mc_eid'}
+
+def canonical_url(url):
+    """Normalize a URL for dedup: scheme, www., default ports, fragments, tracking params"""
+    try:
+        p = urlparse(url.strip())
+        port = p.port
+    except ValueError:
+        return url.strip()  # malformed port or host: dedup on the raw string
+    host = (p.hostname or '').lower().removeprefix('www.')
+    if port and port not in (80, 443): host += f":{port}"
+    query = "&".join(sorted(
+        q for q in p.query.split("&")
+        if q and not q.startswith("utm_") and q.split("=")[0] not in TRACKING_PARAMS
+    ))
+    return urlunparse(('', host, p.path.rstrip('/') or '/', '', query, ''))
+
+def merge_results(lists, k=60):
+    """Dedup by canonical URL and rank by reciprocal rank fusion across instances"""
+    scores, best = {}, {}
+    for results in lists:
+        seen = set()
+        for rank, r in enumerate(results[:SEARCH_MERGE_DEPTH]):
+            key = canonical_url(r.url)
+            if key in seen: continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0) + 1 / (k + rank + 1)
+            # Keep the copy with the most snippet text
+            if key not in best or len(r.snippet) > len(best[key].snippet):
+                best[key] = r
+    return tuple(best[key] for key in sorted(scores, key=scores.get, reverse=True))
+
+def fetch_coalesced(query, page=1):
+    """Fetch a query upstream, joining any fetch of the same query already running"""
+    key = (query, page)
+    with _search_lock:
+        flight = _search_inflight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _search_inflight[key] = _Flight()
+
+    if not leader:
+        flight.done.wait()
+        return flight.results
+
+    try:
+        flight.results = fetch_results(query, page)
+        if flight.results is not None:
+            fetched_at = time.time()
+            remember(key, fetched_at, flight.results)
+            persist_results(key, fetched_at, flight.results)
+            index_results(flight.results)
+    finally:
+        with _search_lock:
+            del _search_inflight[key]
+        flight.done.set()
+    return flight.results
+
+def remember(key, fetched_at, results):
+    with _search_lock:
+        _search_cache[key] = (fetched_at, results)
+        _search_cache.move_to_end(key)
+        while len(_search_cache) > SEARCH_CACHE_SIZE:
+            _search_cache.popitem(last=False)
+
+def persist_results(key, fetched_at, results):
+    """Write a result page to the on-disk cache and drop entries too old to serve"""
+    conn = db()
+    try:
+        conn.execute("INSERT OR REPLACE INTO search_cache (query, page, fetched_at, results) VALUES (?, ?, ?, ?)",
+                    (*key, fetched_at, pack_results(results)))
+        conn.execute("DELETE FROM search_cache WHERE fetched_at < ?", (fetched_at - SEARCH_CACHE_STALE,))
+        conn.commit()
+    except sqlite3.Error:
+        pass  # Best-effort, like the local index
+    conn.close()
+
+def load_results(key):
+    """Read a result page from the on-disk cache (after a restart or memory eviction)"""
+    conn = db()
+    try:
+        row = conn.execute("SELECT fetched_at, results FROM search_cache WHERE query = ? AND page = ?", key).fetchone()
+    except sqlite3.Error:
+        row = None
+    conn.close()
+    if not row: return None
+    entry = (row['fetched_at'], unpack_results(row['results']))
+    remember(key, *entry)
+    return entry
+
+def cached_results(query, page=1):
+    """Cached results if fresh or stale; stale hits trigger a background refresh"""
+    key = (query, page)
+    with _search_lock:
+        entry = _search_cache.get(key)
+        if entry: _search_cache.move_to_end(key)
+        refreshing = key in _search_inflight
+    if not entry:
+        entry = load_results(key)
+        if not entry: return None
+
+    age = time.time() - entry[0]
+    if age < SEARCH_CACHE_TTL:
+        return entry[1]
+    if age < SEARCH_CACHE_STALE:
+        if not refreshing:
+            threading.Thread(target=fetch_coalesced, args=key, daemon=True).start()
+        return entry[1]
+    return None
+
+def prefetch(query, page):
+    """Warm the cache for a page the user is likely to open next.
+
+    Never logs usage, so it doesn't count against TIERS, and at most
+    SEARCH_PREFETCH_MAX run at once; extra prefetches are simply skipped.
+    """
+    key = (query, page)
+    with _search_lock:
+        entry = _search_cache.get(key)
+        if key in _search_inflight or (entry and time.time() - entry[0] < SEARCH_CACHE_TTL):
+            return
+    if not _prefetch_slots.acquire(blocking=False):
+        return
+
+    def run():
+        try: fetch_coalesced(query, page)
+        finally: _prefetch_slots.release()
+    threading.Thread(target=run, daemon=True).start()
+
+def search(query, user_id=None, user_tier='free', page=1):
     if not query: return []
+    page = max(1, min(int(page), SEARCH_MAX_PAGE))
 
     # Check usage limit
     if user_id:
@@ -350,20 +1027,107 @@ def search(query, user_id=None, user_tier='free'):
         if not ok:
             return {'error': err}
 
-    for instance in SEARXNG:
-        try:
-            url = f"{instance}/search?{urlencode({'q': query, 'format': 'json'})}"
-            req = urllib.request.Request(url, headers={"User-Agent": "D2D/1.0"})
-            with urllib.request.urlopen(req, timeout=10) as r:
-                results = json.loads(r.read()).get("results", [])[:15]
+    key = " ".join(query.lower().split())
+    results = cached_results(key, page)
+    if results is None:
+        results = fetch_coalesced(key, page)
+
+    if results is None:
+        # Every instance failed: answer from what we've seen before
+        return local_search(query, user_id) if page == 1 else []
+
+    # Log successful search
+    if user_id:
+        log_usage(user_id, 'searches')
+
+    # Speculatively fetch the next page, unless the user can't view it anyway
+    if results and page < SEARCH_MAX_PAGE and (not user_id or check_limit(user_id, 'searches', user_tier)[0]):
+        prefetch(key, page + 1)
+    return results
 
-                # Log successful search
-                if user_id:
-                    log_usage(user_id, 'searches')
+# ============================================================================
+# SEARCH API (widgets)
+# ============================================================================
+# Same cache and coalescing as /search; widgets on many sites asking the same
+# thing cost one upstream fetch. Callers authenticate with an API token (see
+# api_login), and each member gets one request bucket on top of the daily
+# TIERS limit, however many tokens they hold.
+
+_api_limit = RateLimiter(API_RATE, API_BURST)
+
+def api_search(user, query, page=1, fields=None):
+    """(JSON body, status, error) for /api/search"""
+    if not query:
+        return None, 400, "Missing q"
+    fields = [f for f in (fields or "title,url,snippet").split(",") if f in API_FIELDS] or ['title', 'url', 'snippet']
+    results = search(query, user['id'], user['tier'], page)
+    if isinstance(results, dict):
+        return None, 429, results['error']
+    body = {
+        "q": query,
+        "page": page,
+        "local": any(r.local for r in results),
+        "fields": fields,
+        "results": [[getattr(r, f) for f in fields] for r in results],  # rows in `fields` order
+    }
+    return json.dumps(body, separators=(',', ':')), 200, None
+
+# ============================================================================
+# LOCAL SEARCH INDEX (fallback when SearXNG is down)
+# ============================================================================
+
+_index_writes = 0
+
+def index_results(results):
+    """Add fetched results to the local index, evicting the oldest past the budget"""
+    global _index_writes
+    docs = [(r.url, r.title, r.snippet) for r in results]
+    if not docs: return
+    # Counting the index is a scan, so the budget is enforced on the first
+    # write and every SEARCH_INDEX_TRIM_EVERY after; it may overshoot by that many batches
+    _index_writes += 1
+    trim = _index_writes % SEARCH_INDEX_TRIM_EVERY == 1 or SEARCH_INDEX_TRIM_EVERY == 1
+    conn = db()
+    try:
+        conn.executemany("""
+            INSERT INTO search_docs (url, title, snippet) VALUES (?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET title = excluded.title, snippet = excluded.snippet,
+                                           last_seen = CURRENT_TIMESTAMP
+        """, docs)
+        over = trim and conn.execute("SELECT COUNT(*) FROM search_docs").fetchone()[0] - SEARCH_INDEX_MAX_DOCS
+        if over > 0:
+            conn.execute("DELETE FROM search_docs WHERE id IN (SELECT id FROM search_docs ORDER BY last_seen, id LIMIT ?)", (over,))
+        conn.commit()
+    except sqlite3.Error:
+        pass  # The index is best-effort; never fail a search over it
+    conn.close()
+
+def local_search(query, user_id=None, limit=15):
+    """Search previously fetched results and the user's saved items"""
+    match = fts_query(query)
+    if not match: return []
+
+    results, seen = [], set()
+    for s in (search_saved(user_id, query, limit) if user_id else []):
+        if s['url'] not in seen:
+            seen.add(s['url'])
+            results.append(Result(s['title'], s['url'], s['snippet'], local=True))
+
+    conn = db()
+    try:
+        rows = conn.execute("""
+            SELECT d.title, d.url, d.snippet FROM search_docs_fts JOIN search_docs d ON d.id = search_docs_fts.rowid
+            WHERE search_docs_fts MATCH ? ORDER BY bm25(search_docs_fts, 10.0, 2.0, 1.0) LIMIT ?
+        """, (match, limit)).fetchall()
+    except sqlite3.Error:
+        rows = []
+    conn.close()
 
-                return results
-        except: continue
-    return []
+    for r in rows:
+        if r['url'] not in seen:
+            seen.add(r['url'])
+            results.append(Result(r['title'], r['url'], r['snippet'], local=True))
+    return results[:limit]
 
 # ============================================================================
 # SAVED
@@ -390,6 +1154,26 @@ def get_saved(user_id):
     conn.close()
     return [dict(r) for r in rows]
 
+def fts_query(q):
+    """Turn user input into a safe FTS5 query: every word must match, last one as a prefix."""
+    words = [w.replace('"', '""') for w in q.split()]
+    if not words: return None
+    return " ".join(f'"{w}"' for w in words[:-1]) + f' "{words[-1]}"*'
+
+def search_saved(user_id, q, limit=50):
+    """Ranked full-text search over a user's saved results"""
+    match = fts_query(q)
+    if not match: return []
+    conn = db()
+    rows = conn.execute("""
+        SELECT s.*, snippet(saved_fts, 2, '<mark>', '</mark>', '…', 16) AS hit
+        FROM saved_fts JOIN saved s ON s.id = saved_fts.rowid
+        WHERE saved_fts MATCH ? AND s.user_id = ?
+        ORDER BY bm25(saved_fts, 10.0, 2.0, 1.0) LIMIT ?
+    """, (match, user_id, limit)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
 def delete_saved(user_id, sid):
     conn = db()
     conn.execute("DELETE FROM saved WHERE id = ? AND user_id = ?", (sid, user_id))
@@ -423,6 +1207,20 @@ def get_content(user_id):
     conn.close()
     return [dict(r) for r in rows]
 
+def search_content(user_id, q, limit=50):
+    """Ranked full-text search over a user's registered content"""
+    match = fts_query(q)
+    if not match: return []
+    conn = db()
+    rows = conn.execute("""
+        SELECT c.*, snippet(content_fts, 1, '<mark>', '</mark>', '…', 16) AS hit
+        FROM content_fts JOIN content c ON c.id = content_fts.rowid
+        WHERE content_fts MATCH ? AND c.user_id = ?
+        ORDER BY bm25(content_fts, 10.0, 1.0) LIMIT ?
+    """, (match, user_id, limit)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
 def get_by_uuid(uid):
     conn = db()
     row = conn.execute("SELECT * FROM content WHERE uuid = ?", (uid,)).fetchone()
@@ -446,12 +1244,141 @@ def export_md(user_id):
     return md
 
 def delete_all(user_id):
+    """Delete a user and everything they own in one transaction.
+
+    saved, content, usage, project_stars and api_tokens go with the user through their
+    ON DELETE CASCADE foreign keys; the star counts they added are taken back first.
+    checkout_sessions has no foreign key, so it's matched by email and customer id.
+    """
     conn = db()
-    conn.execute("DELETE FROM saved WHERE user_id = ?", (user_id,))
-    conn.execute("DELETE FROM content WHERE user_id = ?", (user_id,))
-    conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
-    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        user = conn.execute("SELECT email, stripe_customer_id FROM users WHERE id = ?", (user_id,)).fetchone()
+        if user:
+            conn.execute("DELETE FROM checkout_sessions WHERE email = ? OR customer_id = ?",
+                        (user['email'], user['stripe_customer_id']))
+        starred = [r['project_id'] for r in
+                   conn.execute("SELECT project_id FROM project_stars WHERE user_id = ?", (user_id,))]
+        if starred:
+            conn.executemany("UPDATE projects SET stars = MAX(stars - 1, 0) WHERE id = ?", [(p,) for p in starred])
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        if starred:
+            backfill_trending(conn, starred)
+            bump_version(conn, 'projects_version')
+        # Bumped, not deleted, so a reused user id never matches a stale cached set
+        bump_version(conn, stars_key(user_id))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    forget_user_stars(user_id)
+
+# ============================================================================
+# RETENTION
+# ============================================================================
+
+def run_retention(now=None):
+    """Roll old daily usage into usage_monthly, prune old webhook ids, release free pages"""
+    now = now or datetime.now()
+    cutoff = (now - timedelta(days=USAGE_RETENTION_DAYS)).strftime('%Y-%m-%d')
+    conn = db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("""
+            INSERT INTO usage_monthly (user_id, action, month, count)
+            SELECT user_id, action, substr(date, 1, 7), SUM(count) FROM usage
+            WHERE date < ? GROUP BY user_id, action, substr(date, 1, 7)
+            ON CONFLICT(user_id, action, month) DO UPDATE SET count = count + excluded.count
+        """, (cutoff,))
+        rolled = conn.execute("DELETE FROM usage WHERE date < ?", (cutoff,)).rowcount
+        # Stripe stops retrying a webhook after 3 days; a month of ids is plenty for dedup
+        conn.execute("DELETE FROM stripe_events WHERE received_at < datetime('now', '-30 days')")
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    conn.execute("PRAGMA incremental_vacuum").fetchall()  # runs one step per row read
     conn.close()
+    return rolled
+
+def retention_loop():
+    while True:
+        try:
+            run_retention()
+        except sqlite3.Error as e:
+            print(f"Retention error: {e}")
+        time.sleep(RETENTION_INTERVAL)
+
+# ============================================================================
+# PUBLIC STATS
+# ============================================================================
+# /stats and /stats.json are served from memory. mrr.py replaces stats.json
+# atomically, so a changed mtime means a new complete file; the live counters
+# are recounted at most every STATS_LIVE_TTL seconds.
+
+_stats = {"mtime": None, "file": {}, "counted_at": 0, "html": "", "json": "{}", "etag": '""'}
+_stats_lock = threading.Lock()
+
+def live_counters():
+    today = datetime.now().strftime('%Y-%m-%d')
+    conn = db()
+    row = conn.execute("""
+        SELECT (SELECT COALESCE(SUM(count), 0) FROM usage WHERE action = 'searches' AND date = ?) AS searches_today,
+               (SELECT COUNT(*) FROM content) AS registrations_total,
+               (SELECT COUNT(*) FROM projects) AS projects_tracked
+    """, (today,)).fetchone()
+    conn.close()
+    return dict(row)
+
+def render_public_stats(stats):
+    return f"""
+    <h2>Live Stats</h2>
+    <p style="color:#888;margin-bottom:20px">Open startup transparency. Updated hourly.</p>
+
+    <div class="stats">
+        <div class="stat"><b>${stats.get('mrr_dollars', 0)}</b><span>MRR</span></div>
+        <div class="stat"><b>{stats.get('customers', 0)}</b><span>Paying Members</span></div>
+        <div class="stat"><b>{stats.get('searches_today', 0)}</b><span>Searches Today</span></div>
+    </div>
+
+    <div class="stats">
+        <div class="stat"><b>{stats.get('registrations_total', 0)}</b><span>Content Registered</span></div>
+        <div class="stat"><b>{stats.get('projects_tracked', 0)}</b><span>Projects Tracked</span></div>
+    </div>
+
+    <p style="margin-top:30px;color:#666;font-size:13px">
+        Want to contribute? <a href="/" style="color:#0f0">Join for $1/month</a>
+    </p>
+    """
+
+def public_stats():
+    """Current stats snapshot: dict with pre-rendered 'html', 'json' and 'etag'"""
+    global _stats
+    try:
+        mtime = os.stat(STATS_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
+    snapshot = _stats
+    if mtime == snapshot["mtime"] and time.time() - snapshot["counted_at"] < STATS_LIVE_TTL:
+        return snapshot
+
+    with _stats_lock:
+        file_stats = snapshot["file"]
+        if mtime != snapshot["mtime"]:
+            try:
+                with open(STATS_FILE) as f:
+                    file_stats = json.load(f)
+            except (OSError, ValueError):
+                file_stats = {} if mtime is None else file_stats  # keep the last good copy
+        stats = {"mrr_dollars": 0, "customers": 0, **file_stats, **live_counters()}
+        body = json.dumps(stats, separators=(",", ":"))
+        # Swapped in whole so readers never mix an old ETag with a new body
+        _stats = {"mtime": mtime, "file": file_stats, "counted_at": time.time(),
+                  "html": render_public_stats(stats), "json": body,
+                  "etag": f'"{hashlib.sha256(body.encode()).hexdigest()[:16]}"'}
+        return _stats
 
 # ============================================================================
 # HTML
@@ -490,18 +1417,26 @@ footer{margin-top:40px;padding:20px 0;border-top:1px solid #222;text-align:cente
 .result .url{color:#666;font-size:12px}
 .result .snippet{color:#999;font-size:13px;margin:5px 0}
 .result button{background:#222;color:#888;border:none;padding:4px 10px;font-size:11px;cursor:pointer}
+mark{background:none;color:#0f0}
 """
 
-def html(title, body, user=None):
-    nav = '<a href="/search">Search</a><a href="/saved">Saved</a><a href="/content">Content</a><a href="/discover">Discover</a><a href="/changelog">Changelog</a><a href="/export">Export</a><a href="/logout">Logout</a>' if user else '<a href="/">Login</a><a href="/stats">Stats</a><a href="/changelog">Changelog</a>'
+def html_head(title, user=None):
+    """Everything up to the page body (sent early by streaming pages)"""
+    nav = '<a href="/search">Search</a><a href="/saved">Saved</a><a href="/content">Content</a><a href="/discover">Discover</a><a href="/changelog">Changelog</a><a href="/export">Export</a><a href="/tokens">API</a><a href="/logout">Logout</a>' if user else '<a href="/">Login</a><a href="/stats">Stats</a><a href="/changelog">Changelog</a>'
     return f"""<!DOCTYPE html>
 <html><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width,initial-scale=1">
 <title>{title}</title><style>{CSS}</style></head><body>
 <header><h1>D2D <span style="color:#666;font-size:12px">{VERSION}</span></h1><nav>{nav}</nav></header>
-{body}
+"""
+
+def html_tail():
+    return f"""
 <footer>Death2Data · Port {PORT} · {VERSION}</footer>
 </body></html>"""
 
+def html(title, body, user=None):
+    return html_head(title, user) + body + html_tail()
+
 # ============================================================================
 # PAGES
 # ============================================================================
@@ -544,6 +1479,13 @@ def page_analytics(user):
 
     conn.close()
 
+    upstream = "".join(
+        f"<div class=\"card\"><h3>{host} <small>{m['state']}</small></h3>"
+        f"<p>{m['ok']} ok · {m['failures']} failed ({m['timeouts']} timeouts) · "
+        f"{m['retries']} retries · {m['rejected']} skipped · p95 {m['p95_ms'] or '-'} ms</p></div>"
+        for host, m in outbound.metrics().items()
+    ) or '<div class="empty">No outbound calls yet</div>'
+
     return f"""
     <h2>Analytics Dashboard</h2>
     <div class="stats">
@@ -562,60 +1504,53 @@ def page_analytics(user):
         <div class="stat"><b>{cohort_a}</b><span>Cohort A</span></div>
         <div class="stat"><b>{cohort_b}</b><span>Cohort B</span></div>
     </div>
+    <h2>Upstream Services</h2>
+    {upstream}
     """
 
-def page_discover(user):
+def discover_cards(sort='top'):
+    """Pre-rendered (project id, stars, card head, card tail) for each project, cached with the list"""
+    projects = get_projects(sort)
+    cached = _projects[sort].get("cards")
+    if cached and cached[0] is projects:
+        return cached[1]
+    cards = [(p['id'], p['stars'], f"""<div class="card">
+                <h3>{p['name']}</h3>
+                <p>{p['description']}</p>
+                <small style="color:#666">Score: {p['score']}/100 · {p['category']}</small><br>
+                <a href="{p['url']}" target="_blank" style="color:#0f0;margin-right:15px">Visit</a>
+                """, """
+            </div>""") for p in projects]
+    _projects[sort]["cards"] = (projects, cards)
+    return cards
+
+def page_discover(user, sort='top'):
     """Golden Ticket - Project Discovery"""
-    projects = get_projects()
+    sort = sort if sort in PROJECT_SORTS else 'top'
+    cards = discover_cards(sort)
     user_stars = get_user_stars(user['id']) if user else set()
 
     h = "<h2>Golden Ticket: Project Discovery</h2>"
     h += '<p style="color:#888;margin-bottom:20px">Star projects you think will succeed. Early stars = bragging rights.</p>'
+    h += '<p style="margin-bottom:20px">' + " · ".join(
+        f'<b>{s.title()}</b>' if s == sort else f'<a href="/discover?sort={s}" style="color:#0f0">{s.title()}</a>'
+        for s in PROJECT_SORTS) + '</p>'
 
-    if not projects:
+    if not cards:
         h += '<div class="empty">No projects yet. Check back soon!</div>'
     else:
-        for p in projects:
-            starred = p['id'] in user_stars
-            star_btn = f'<span style="color:#666">★ {p["stars"]}</span>' if starred else f'<form method="POST" action="/star" style="display:inline"><input type="hidden" name="project_id" value="{p["id"]}"><button style="background:none;border:none;color:#0f0;cursor:pointer;font-size:14px">☆ Star ({p["stars"]})</button></form>'
-
-            h += f"""<div class="card">
-                <h3>{p['name']}</h3>
-                <p>{p['description']}</p>
-                <small style="color:#666">Score: {p['score']}/100 · {p['category']}</small><br>
-                <a href="{p['url']}" target="_blank" style="color:#0f0;margin-right:15px">Visit</a>
-                {star_btn}
-            </div>"""
+        parts = [h]
+        for pid, stars, head, tail in cards:
+            starred = pid in user_stars
+            star_btn = f'<span style="color:#666">★ {stars}</span>' if starred else f'<form method="POST" action="/star" style="display:inline"><input type="hidden" name="project_id" value="{pid}"><input type="hidden" name="sort" value="{sort}"><button style="background:none;border:none;color:#0f0;cursor:pointer;font-size:14px">☆ Star ({stars})</button></form>'
+            parts += (head, star_btn, tail)
+        h = "".join(parts)
 
     return h
 
 def page_public_stats():
     """Public stats page - no login required"""
-    try:
-        with open("stats.json") as f:
-            stats = json.load(f)
-    except:
-        stats = {"mrr_dollars": 0, "customers": 0, "searches_today": 0, "projects_tracked": 0}
-
-    return f"""
-    <h2>Live Stats</h2>
-    <p style="color:#888;margin-bottom:20px">Open startup transparency. Updated hourly.</p>
-
-    <div class="stats">
-        <div class="stat"><b>${stats.get('mrr_dollars', 0)}</b><span>MRR</span></div>
-        <div class="stat"><b>{stats.get('customers', 0)}</b><span>Paying Members</span></div>
-        <div class="stat"><b>{stats.get('searches_today', 0)}</b><span>Searches Today</span></div>
-    </div>
-
-    <div class="stats">
-        <div class="stat"><b>{stats.get('registrations_total', 0)}</b><span>Content Registered</span></div>
-        <div class="stat"><b>{stats.get('projects_tracked', 0)}</b><span>Projects Tracked</span></div>
-    </div>
-
-    <p style="margin-top:30px;color:#666;font-size:13px">
-        Want to contribute? <a href="/" style="color:#0f0">Join for $1/month</a>
-    </p>
-    """
+    return public_stats()["html"]
 
 def page_home(user):
     if user:
@@ -660,16 +1595,17 @@ def page_home(user):
     <p style="color:#555;font-size:13px">Have a token? <a href="/login" style="color:#0f0">Login</a></p>
     """
 
-def page_search(user, q, results):
-    r_html = ""
+def search_box(q):
+    return f"""
+    <form action="/search" method="GET" class="search">
+        <input type="text" name="q" value="{q}" placeholder="Search..." autofocus>
+        <button>Search</button>
+    </form>
+    """
 
-    # Check if results is an error dict
-    if isinstance(results, dict) and 'error' in results:
-        r_html = f'<div class="empty" style="color:#f66">{results["error"]}</div>'
-    elif results:
-        for r in results:
-            t, u, s = r.get('title',''), r.get('url',''), r.get('content','')[:200]
-            r_html += f"""<div class="result">
+def result_html(r, q):
+    t, u, s = r.title, r.url, r.snippet
+    return f"""<div class="result">
                 <h3><a href="{u}" target="_blank">{t}</a></h3>
                 <div class="url">{u[:60]}</div>
                 <div class="snippet">{s}</div>
@@ -681,24 +1617,42 @@ def page_search(user, q, results):
                     <button>+ Save</button>
                 </form>
             </div>"""
+
+def pager_html(q, page, results):
+    links = []
+    if page > 1:
+        links.append(f'<a href="/search?{urlencode({"q": q, "page": page - 1})}" style="color:#0f0">← Prev</a>')
+    links.append(f'<span style="color:#666">Page {page}</span>')
+    if results and not isinstance(results, dict) and not results[0].local and page < SEARCH_MAX_PAGE:
+        links.append(f'<a href="/search?{urlencode({"q": q, "page": page + 1})}" style="color:#0f0">Next →</a>')
+    return f'<div style="display:flex;gap:20px;justify-content:center;padding:20px 0;font-size:13px">{"".join(links)}</div>'
+
+def results_html(q, results, page=1):
+    """Search results as a sequence of HTML fragments, in display order"""
+    # Check if results is an error dict
+    if isinstance(results, dict) and 'error' in results:
+        yield f'<div class="empty" style="color:#f66">{results["error"]}</div>'
+    elif results:
+        if results[0].local:
+            yield '<div class="empty" style="padding:10px;color:#fa0">Search is unreachable right now. Showing matches from earlier results and your saved items.</div>'
+        for r in results:
+            yield result_html(r, q)
     elif q:
-        r_html = '<div class="empty">No results</div>'
+        yield '<div class="empty">No results</div>'
+    if q and (results or page > 1):
+        yield pager_html(q, page, results)
 
-    return f"""
-    <form action="/search" method="GET" class="search">
-        <input type="text" name="q" value="{q}" placeholder="Search..." autofocus>
-        <button>Search</button>
-    </form>
-    {r_html}
-    """
+def page_search(user, q, results, page=1):
+    return search_box(q) + "".join(results_html(q, results, page))
 
-def page_saved(user):
-    items = get_saved(user['id'])
+def page_saved(user, q=""):
+    items = search_saved(user['id'], q) if q else get_saved(user['id'])
     h = ""
     for s in items:
+        snippet = s['hit'] if q else (s['snippet'][:100] if s['snippet'] else '')
         h += f"""<div class="card">
             <h3>{s['title']}</h3>
-            <p>{s['snippet'][:100] if s['snippet'] else ''}...</p>
+            <p>{snippet}...</p>
             <small>{s['created_at'][:10]}</small><br>
             <a href="{s['url']}" target="_blank">Open</a>
             <form method="POST" action="/saved/delete" style="display:inline">
@@ -706,18 +1660,24 @@ def page_saved(user):
                 <button style="background:none;border:none;color:#f66;cursor:pointer;font-size:12px">Delete</button>
             </form>
         </div>"""
-    return f"<h2>Saved ({len(items)})</h2>{h or '<div class=\"empty\">Nothing saved</div>'}"
+    form = f'<form action="/saved" method="GET" class="search"><input type="text" name="q" value="{q}" placeholder="Search saved..."><button>Search</button></form>'
+    title = f"Saved matching “{q}” ({len(items)})" if q else f"Saved ({len(items)})"
+    empty = '<div class="empty">Nothing saved</div>'
+    return f"<h2>{title}</h2>{form}{h or empty}"
 
-def page_content(user):
-    items = get_content(user['id'])
+def page_content(user, q=""):
+    items = search_content(user['id'], q) if q else get_content(user['id'])
     h = ""
     for c in items:
+        hit = f"<p>{c['hit']}</p>" if q and c['hit'] else ""
         h += f"""<div class="card">
             <h3>{c['title']}</h3>
+            {hit}
             <span class="uuid">{c['uuid']}</span>
             <br><small>{c['content_type']} · {c['created_at'][:10]}</small>
             <br><a href="/verify/{c['uuid']}">Verify</a>
         </div>"""
+    empty = '<div class="empty">Nothing registered</div>'
     return f"""
     <h2>Registered Content ({len(items)})</h2>
     <form class="box" method="POST" action="/register">
@@ -732,7 +1692,11 @@ def page_content(user):
         </select>
         <button>Register</button>
     </form>
-    {h or '<div class=\"empty\">Nothing registered</div>'}
+    <form action="/content" method="GET" class="search">
+        <input type="text" name="q" value="{q}" placeholder="Search content...">
+        <button>Search</button>
+    </form>
+    {h or empty}
     """
 
 def page_verify(uid):
@@ -760,37 +1724,108 @@ def page_export(user):
     </form>
     """
 
+def page_tokens(user, new_token=None):
+    h = "<h2>API Tokens</h2><p>For the search widget and other scripts. A token can only call /api/search, and revoking it stops it at once. Your login token never goes in a page.</p>"
+    if new_token:
+        h += f'<div class="card" style="border-color:#0f0"><p>New token, shown only once:</p><pre style="color:#0f0">{new_token}</pre></div>'
+    for t in get_api_tokens(user['id']):
+        h += f"""<div class="card">
+            <span class="uuid">{t['prefix']}…</span>
+            <br><small>{t['scope']} · {t['created_at'][:10]}</small>
+            <form method="POST" action="/tokens/revoke" style="display:inline">
+                <input type="hidden" name="id" value="{t['id']}">
+                <button style="background:none;border:none;color:#f66;cursor:pointer;font-size:12px">Revoke</button>
+            </form>
+        </div>"""
+    h += '<form class="box" method="POST" action="/tokens"><button>New Search Token</button></form>'
+    return h
+
 # ============================================================================
 # SERVER
 # ============================================================================
 
 class H(BaseHTTPRequestHandler):
+    # HTTP/1.1 so /search can use chunked encoding; every other response sets Content-Length
+    protocol_version = "HTTP/1.1"
+
+    ip_limit = RateLimiter(IP_RATE, IP_BURST)
+    token_limit = RateLimiter(TOKEN_RATE, TOKEN_BURST)
+    auth_limit = RateLimiter(AUTH_RATE, AUTH_BURST)
+
+    def rate_limited(self):
+        """Send 429 and return True if this request is over any of its buckets"""
+        path = urlparse(self.path).path
+        if path == "/stripe/webhook":
+            return False  # signed, and Stripe retries on its own schedule
+        ip, token = client_ip(self, TRUSTED_PROXY), self.token()
+        checks = [(self.ip_limit, ip)]
+        if token:
+            checks.append((self.token_limit, token))
+        if self.command == "POST" and path in ("/signup", "/login"):
+            checks.append((self.auth_limit, ip))
+        for limiter, key in checks:
+            ok, retry_after = limiter.allow(key)
+            if not ok:
+                self.close_connection = True  # don't leave an unread body on a kept-alive socket
+                self.send("Too many requests", 429, {"Content-Type": "text/plain", "Retry-After": str(math.ceil(retry_after)),
+                                                     "Connection": "close"})
+                return True
+        return False
+
     def token(self):
         for p in self.headers.get("Cookie","").split(";"):
             if "token=" in p: return p.split("=")[1].strip()
         return None
     
     def send(self, body, status=200, headers=None):
+        data = body.encode()
+        headers = dict(headers or {})
         self.send_response(status)
-        self.send_header("Content-Type", "text/html")
-        for k,v in (headers or {}).items(): self.send_header(k,v)
+        self.send_header("Content-Type", headers.pop("Content-Type", "text/html"))
+        self.send_header("Content-Length", str(len(data)))
+        for k,v in headers.items(): self.send_header(k,v)
         self.end_headers()
-        self.wfile.write(body.encode())
+        self.wfile.write(data)
     
     def file(self, data, mime, name):
+        data = data.encode()
         self.send_response(200)
         self.send_header("Content-Type", mime)
         self.send_header("Content-Disposition", f"attachment; filename={name}")
+        self.send_header("Content-Length", str(len(data)))
         self.end_headers()
-        self.wfile.write(data.encode())
+        self.wfile.write(data)
     
     def redir(self, url, cookie=None):
         self.send_response(303)
         self.send_header("Location", url)
+        self.send_header("Content-Length", "0")
         if cookie: self.send_header("Set-Cookie", cookie)
         self.end_headers()
+
+    def chunk(self, text):
+        """Write one chunk of a chunked response and push it to the client"""
+        data = text.encode()
+        if data:
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    def stream_search(self, user, q, page=1):
+        """Flush the page shell and search box first, then results once they arrive"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.chunk(html_head("Search", user) + search_box(q))
+
+        results = search(q, user['id'], user['tier'], page)
+        for fragment in results_html(q, results, page):
+            self.chunk(fragment)
+        self.chunk(html_tail())
+        self.wfile.write(b"0\r\n\r\n")
     
     def do_GET(self):
+        if self.rate_limited(): return
         p = urlparse(self.path)
         path, params = p.path, parse_qs(p.query)
         user = login(self.token())
@@ -800,6 +1835,8 @@ class H(BaseHTTPRequestHandler):
         if path == "/logout": return self.redir("/", "token=; Path=/; Max-Age=0")
         if path == "/changelog": return self.send(html("Changelog", page_changelog(), user))
         if path == "/stats": return self.send(html("Stats", page_public_stats(), user))
+        if path == "/stats.json": return self.stats_json()
+        if path == "/api/search": return self.api_search(params)
         if path.startswith("/verify/"): return self.send(html("Verify", page_verify(path.split("/")[-1]), user))
 
         # Stripe checkout
@@ -815,26 +1852,25 @@ class H(BaseHTTPRequestHandler):
             if not session_id:
                 return self.redir("/")
 
-            session = get_checkout_session(session_id)
-            if not session:
+            session = lookup_checkout(session_id)
+            if not session or not session['email']:
                 return self.send(html("Error", '<div class="empty" style="color:#f66">Invalid session</div><a href="/" style="color:#0f0">Back</a>', user))
 
-            email = session.get("customer_details", {}).get("email")
-            customer_id = session.get("customer")
-            token, _ = signup(email, customer_id)
+            token, _ = signup(session['email'], session['customer_id'])
 
             return self.send(html("Success", f'<h2>You\'re In!</h2><p>Save this token:</p><pre style="color:#0f0;background:#000;padding:15px;font-family:monospace">{token}</pre><p><a href="/" style="color:#0f0">Continue</a></p>'), headers={"Set-Cookie": f"token={token}; Path=/; HttpOnly"})
 
         if not user: return self.redir("/")
 
         if path == "/search":
-            q = params.get("q",[""])[0]
-            results = search(q, user['id'], user['tier'])
-            return self.send(html("Search", page_search(user, q, results), user))
-        if path == "/saved": return self.send(html("Saved", page_saved(user), user))
-        if path == "/content": return self.send(html("Content", page_content(user), user))
-        if path == "/discover": return self.send(html("Discover", page_discover(user), user))
+            page = params.get("page",["1"])[0]
+            page = max(1, min(int(page) if page.isdigit() else 1, SEARCH_MAX_PAGE))
+            return self.stream_search(user, params.get("q",[""])[0], page)
+        if path == "/saved": return self.send(html("Saved", page_saved(user, params.get("q",[""])[0].strip()), user))
+        if path == "/content": return self.send(html("Content", page_content(user, params.get("q",[""])[0].strip()), user))
+        if path == "/discover": return self.send(html("Discover", page_discover(user, params.get("sort",["top"])[0]), user))
         if path == "/analytics": return self.send(html("Analytics", page_analytics(user), user))
+        if path == "/tokens": return self.send(html("API Tokens", page_tokens(user), user))
         if path == "/export":
             f = params.get("f",[None])[0]
             if f == "json": return self.file(export_json(user['id']), "application/json", "export.json")
@@ -843,8 +1879,73 @@ class H(BaseHTTPRequestHandler):
 
         self.send(html("404", "<h2>Not Found</h2>", user), 404)
     
+    def api_token(self):
+        # Header only: tokens in query strings end up in access logs and Referers
+        auth = self.headers.get("Authorization", "")
+        return auth[7:].strip() if auth.startswith("Bearer ") else None
+
+    def api_search(self, params):
+        cors = {"Access-Control-Allow-Origin": "*", "Access-Control-Expose-Headers": "ETag, Retry-After"}
+        json_headers = dict(cors, **{"Content-Type": "application/json"})
+        user = api_login(self.api_token(), 'search')
+        if not user:
+            return self.send('{"error":"Invalid token"}', 401, json_headers)
+
+        ok, retry_after = _api_limit.allow(user['id'])
+        if not ok:
+            return self.send('{"error":"Rate limited"}', 429, dict(json_headers, **{"Retry-After": str(math.ceil(retry_after))}))
+
+        page = params.get("page", ["1"])[0]
+        page = max(1, min(int(page) if page.isdigit() else 1, SEARCH_MAX_PAGE))
+        body, status, error = api_search(user, params.get("q", [""])[0].strip(), page, params.get("fields", [None])[0])
+        if error:
+            return self.send(json.dumps({"error": error}), status, json_headers)
+
+        etag = f'"{hashlib.sha256(body.encode()).hexdigest()[:16]}"'
+        headers = dict(json_headers, **{"ETag": etag, "Cache-Control": f"private, max-age={SEARCH_CACHE_TTL}"})
+        if self.headers.get("If-None-Match") == etag:
+            return self.send("", 304, headers)
+        self.send(body, 200, headers)
+
+    def do_OPTIONS(self):
+        if self.rate_limited(): return
+        if not self.path.startswith("/api/"):
+            return self.send("", 404)
+        self.send("", 200, {"Access-Control-Allow-Origin": "*", "Access-Control-Allow-Methods": "GET, OPTIONS",
+                            "Access-Control-Allow-Headers": "Authorization, If-None-Match",
+                            "Access-Control-Max-Age": "86400"})
+
+    def stats_json(self):
+        stats = public_stats()
+        headers = {"Content-Type": "application/json", "ETag": stats["etag"],
+                   "Cache-Control": f"public, max-age={STATS_LIVE_TTL}", "Access-Control-Allow-Origin": "*"}
+        if self.headers.get("If-None-Match") == stats["etag"]:
+            return self.send("", 304, headers)
+        self.send(stats["json"], 200, headers)
+
+    def stripe_webhook(self, payload):
+        if not verify_stripe_signature(payload, self.headers.get("Stripe-Signature"), STRIPE_WEBHOOK_SECRET):
+            return self.send('{"error": "Invalid signature"}', 400, {"Content-Type": "application/json"})
+        try:
+            event = json.loads(payload)
+            if not isinstance(event, dict) or not event.get("id"):
+                raise ValueError("no event id")
+        except ValueError:
+            return self.send('{"error": "Invalid payload"}', 400, {"Content-Type": "application/json"})
+        try:
+            handle_stripe_event(event)
+        except Exception as e:
+            # Non-2xx makes Stripe retry; nothing was recorded for this event
+            print(f"Stripe webhook error: {e}")
+            return self.send('{"error": "Processing failed"}', 500, {"Content-Type": "application/json"})
+        self.send('{"received": true}', 200, {"Content-Type": "application/json"})
+
     def do_POST(self):
-        data = parse_qs(self.rfile.read(int(self.headers.get("Content-Length",0))).decode())
+        if self.rate_limited(): return
+        raw = self.rfile.read(int(self.headers.get("Content-Length",0)))
+        if self.path == "/stripe/webhook": return self.stripe_webhook(raw)
+
+        data = parse_qs(raw.decode())
         user = login(self.token())
 
         if self.path == "/signup":
@@ -879,7 +1980,17 @@ class H(BaseHTTPRequestHandler):
             project_id = data.get("project_id", [""])[0]
             if project_id:
                 star_project(user['id'], int(project_id))
-            return self.redir("/discover")
+            sort = data.get("sort", ["top"])[0]
+            return self.redir(f"/discover?sort={sort}" if sort in PROJECT_SORTS else "/discover")
+
+        if self.path == "/tokens":
+            return self.send(html("API Tokens", page_tokens(user, create_api_token(user['id'])), user))
+
+        if self.path == "/tokens/revoke":
+            token_id = data.get("id", [""])[0]
+            if token_id.isdigit():
+                revoke_api_token(user['id'], int(token_id))
+            return self.redir("/tokens")
 
         if self.path == "/delete":
             delete_all(user['id'])
@@ -894,28 +2005,8 @@ class H(BaseHTTPRequestHandler):
 # ============================================================================
 
 if __name__ == "__main__":
-    init_db()
-
-    # Add initial changelog entries
-    add_version("v1.0.0", "Auth, Search, Save, Content Registry, Export", "Privacy-first search with ownership tracking")
-    add_version("v1.1.0", "Added CSV export, improved UI", "Save 5-10 min/week with faster exports")
-    add_version("v1.2.0", "Usage tracking, tier limits, changelog, A/B testing", "Track value delivered: X searches, Y saves per day. Data-driven pricing.")
-    add_version("v1.3.0", "Stripe payment integration + Golden Ticket discovery", "One-click payment → instant access. Members get 1000 searches/day. Discover projects early.")
-
-    # Add seed projects
-    conn = db()
-    if conn.execute("SELECT COUNT(*) as c FROM projects").fetchone()['c'] == 0:
-        projects = [
-            ("Death2Data", "https://github.com/deathtodata/death2data", "Privacy-first search engine with content ownership tracking", "search", 85),
-            ("Fortune 0", "https://fortune0.com", "Contribution tracking and equity distribution for open source", "tools", 75),
-            ("Ollama", "https://ollama.com", "Run LLMs locally with zero cloud dependency", "ai", 95),
-            ("SearXNG", "https://github.com/searxng/searxng", "Privacy-respecting metasearch engine", "search", 90),
-        ]
-        for name, url, desc, cat, score in projects:
-            conn.execute("INSERT INTO projects (name, url, description, category, score) VALUES (?, ?, ?, ?, ?)",
-                        (name, url, desc, cat, score))
-        conn.commit()
-    conn.close()
+    bootstrap()
+    threading.Thread(target=retention_loop, daemon=True, name="retention").start()
 
     print(f"""
 ╔═════════════════════════════════════════════╗
@@ -929,4 +2020,4 @@ if __name__ == "__main__":
 ║  Ctrl+C to stop
 ╚═════════════════════════════════════════════╝
 """)
-    HTTPServer(("0.0.0.0", PORT), H).serve_forever()
+    ThreadingHTTPServer(("0.0.0.0", PORT), H).serve_forever()
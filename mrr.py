@@ -8,7 +8,9 @@ MRR DISPLAY SYSTEM
 3. Any site can embed it via raw.githubusercontent.com
 
 Run manually or on a cron:
-    python3 mrr.py
+    python3 mrr.py                  # full recount of active subscriptions
+    python3 mrr.py --incremental    # only pull changes since the last run
+    python3 mrr.py --daemon [--interval 60]   # poll forever, publish only on change
 
 Requires:
     STRIPE_SECRET_KEY=sk_live_xxx
@@ -16,10 +18,17 @@ Requires:
 """
 
 import os
+import sys
 import json
+import time
 import base64
+import sqlite3
 from datetime import datetime
+import urllib.error
 import urllib.request
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from outbound import request, CircuitOpen
 
 # ============================================================================
 # CONFIG
@@ -29,77 +38,218 @@ STRIPE_KEY = os.environ.get("STRIPE_SECRET_KEY")
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
 GITHUB_REPO = "Soulfra/d2d"  # or deathtodata/d2d
 GITHUB_FILE = "stats.json"   # Will be at raw.githubusercontent.com/Soulfra/d2d/main/stats.json
+STRIPE_API = os.environ.get("STRIPE_API", "https://api.stripe.com")
+GITHUB_API = os.environ.get("GITHUB_API", "https://api.github.com")  # point either at a local stub for testing
+SNAPSHOT_DB = os.environ.get("MRR_DB", "mrr.db")  # local copy of subscriptions for --incremental
+EVENT_WINDOW = 29 * 86400    # Stripe keeps events for 30 days; older snapshots get a full resync
+SUBSCRIPTION_EVENTS = ["customer.subscription.created", "customer.subscription.updated",
+                       "customer.subscription.deleted"]
 
 # ============================================================================
 # STRIPE: GET MRR
 # ============================================================================
 
+def stripe_get(path, params):
+    req = urllib.request.Request(f"{STRIPE_API}{path}?{urlencode(params, doseq=True)}")
+    req.add_header("Authorization", f"Bearer {STRIPE_KEY}")
+    return json.loads(request(req, timeout=20, retries=3).decode())
+
+def list_all(path, params):
+    """Yield every object from a Stripe list endpoint, following has_more.
+
+    Cursors only come from the previous page, so pages can't be fetched out
+    of order; instead the next page is requested in the background while the
+    caller works through the current one.
+    """
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        page = stripe_get(path, dict(params, limit=100))
+        while True:
+            data = page.get("data", [])
+            more = page.get("has_more") and data
+            if more:
+                upcoming = pool.submit(stripe_get, path, dict(params, limit=100, starting_after=data[-1]["id"]))
+            yield from data
+            if not more:
+                return
+            page = upcoming.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def monthly_cents(sub):
+    """A subscription's contribution to MRR, in cents"""
+    mrr = 0
+    for item in sub.get("items", {}).get("data", []):
+        price = item.get("price", {})
+        amount = price.get("unit_amount", 0)  # in cents
+        interval = price.get("recurring", {}).get("interval", "month")
+
+        # Convert to monthly
+        if interval == "year":
+            mrr += amount / 12
+        elif interval == "month":
+            mrr += amount
+        elif interval == "week":
+            mrr += amount * 4.33
+        elif interval == "day":
+            mrr += amount * 30
+    return mrr
+
+def make_stats(mrr, customer_count):
+    return {
+        "mrr_cents": int(mrr),
+        "mrr_dollars": round(mrr / 100, 2),
+        "customers": customer_count,
+        "updated_at": datetime.utcnow().isoformat() + "Z"
+    }
+
 def get_stripe_mrr():
     """Fetch MRR from Stripe API."""
     if not STRIPE_KEY:
         print("ERROR: Set STRIPE_SECRET_KEY")
         return None
-    
-    # Get active subscriptions
-    url = "https://api.stripe.com/v1/subscriptions?status=active&limit=100"
-    req = urllib.request.Request(url)
-    req.add_header("Authorization", f"Bearer {STRIPE_KEY}")
-    
+
+    mrr = 0
+    customer_count = 0
     try:
-        with urllib.request.urlopen(req) as resp:
-            data = json.loads(resp.read().decode())
-            
-            mrr = 0
-            customer_count = 0
-            
-            for sub in data.get("data", []):
-                customer_count += 1
-                for item in sub.get("items", {}).get("data", []):
-                    price = item.get("price", {})
-                    amount = price.get("unit_amount", 0)  # in cents
-                    interval = price.get("recurring", {}).get("interval", "month")
-                    
-                    # Convert to monthly
-                    if interval == "year":
-                        mrr += amount / 12
-                    elif interval == "month":
-                        mrr += amount
-                    elif interval == "week":
-                        mrr += amount * 4.33
-                    elif interval == "day":
-                        mrr += amount * 30
-            
-            return {
-                "mrr_cents": int(mrr),
-                "mrr_dollars": round(mrr / 100, 2),
-                "customers": customer_count,
-                "updated_at": datetime.utcnow().isoformat() + "Z"
-            }
-    
+        for sub in list_all("/v1/subscriptions", {"status": "active"}):
+            customer_count += 1
+            mrr += monthly_cents(sub)
+    except Exception as e:
+        print(f"Stripe error: {e}")
+        return None
+
+    return make_stats(mrr, customer_count)
+
+# ============================================================================
+# STRIPE: INCREMENTAL SNAPSHOT
+# ============================================================================
+# The first run (or one after the event window has lapsed) copies every
+# active subscription into SQLite. Later runs only read subscription events
+# created since the last one, so a per-minute cron costs one request when
+# nothing changed.
+
+def snapshot_db():
+    conn = sqlite3.connect(SNAPSHOT_DB)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id TEXT PRIMARY KEY,
+            customer TEXT,
+            status TEXT,
+            monthly_cents REAL,
+            updated INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value INTEGER);
+    """)
+    return conn
+
+def store_subscription(conn, sub, updated):
+    # Events can arrive out of order; never let an older one win
+    conn.execute("""
+        INSERT INTO subscriptions (id, customer, status, monthly_cents, updated) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET customer = excluded.customer, status = excluded.status,
+            monthly_cents = excluded.monthly_cents, updated = excluded.updated
+        WHERE excluded.updated >= subscriptions.updated
+    """, (sub["id"], sub.get("customer"), sub.get("status"), monthly_cents(sub), updated))
+
+def sync_subscriptions(conn):
+    """Bring the snapshot up to date; returns the number of changes applied"""
+    row = conn.execute("SELECT value FROM sync_state WHERE key = 'events_since'").fetchone()
+    now = int(time.time())
+    changes = 0
+
+    if row is None or now - row[0] > EVENT_WINDOW:
+        # Anything that changes mid-sync shows up in the next events pull
+        since = now - 60
+        conn.execute("DELETE FROM subscriptions")
+        for sub in list_all("/v1/subscriptions", {"status": "active"}):
+            store_subscription(conn, sub, now)
+            changes += 1
+    else:
+        since = row[0]
+        # created[gte] re-reads the boundary second; applying an event twice is harmless
+        events = list(list_all("/v1/events", {"types[]": SUBSCRIPTION_EVENTS, "created[gte]": since}))
+        for event in sorted(events, key=lambda e: e["created"]):
+            sub = event["data"]["object"]
+            if event["type"] == "customer.subscription.deleted":
+                sub = dict(sub, status="canceled")
+            store_subscription(conn, sub, event["created"])
+            since = max(since, event["created"])
+            changes += 1
+
+    conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('events_since', ?)", (since,))
+    conn.commit()
+    return changes
+
+def get_stripe_mrr_incremental():
+    """MRR from the local snapshot after pulling changes from Stripe."""
+    if not STRIPE_KEY:
+        print("ERROR: Set STRIPE_SECRET_KEY")
+        return None
+
+    conn = snapshot_db()
+    try:
+        sync_subscriptions(conn)
     except Exception as e:
+        conn.rollback()
+        conn.close()
         print(f"Stripe error: {e}")
         return None
 
+    mrr, customer_count = conn.execute(
+        "SELECT COALESCE(SUM(monthly_cents), 0), COUNT(*) FROM subscriptions WHERE status = 'active'"
+    ).fetchone()
+    conn.close()
+    return make_stats(mrr, customer_count)
+
 def get_stripe_customers():
     """Get customer count."""
     if not STRIPE_KEY:
         return 0
     
-    url = "https://api.stripe.com/v1/customers?limit=1"
+    url = f"{STRIPE_API}/v1/customers?limit=1"
     req = urllib.request.Request(url)
     req.add_header("Authorization", f"Bearer {STRIPE_KEY}")
     
     try:
-        with urllib.request.urlopen(req) as resp:
-            # The total_count isn't directly available, but we can get it from subscriptions
-            return None
-    except:
+        request(req, timeout=10)
+        # The total_count isn't directly available, but we can get it from subscriptions
+        return None
+    except (OSError, CircuitOpen):
         return None
 
 # ============================================================================
 # GITHUB: SAVE STATS
 # ============================================================================
 
+# Last version we know is on GitHub. The daemon keeps this between polls so
+# an unchanged MRR costs no GitHub calls at all, and a change costs one PUT.
+_published = {"sha": None, "stats": None}
+
+def github_request(method="GET", payload=None):
+    req = urllib.request.Request(f"{GITHUB_API}/repos/{GITHUB_REPO}/contents/{GITHUB_FILE}", method=method)
+    req.add_header("Authorization", f"token {GITHUB_TOKEN}")
+    req.add_header("Accept", "application/vnd.github.v3+json")
+    if payload is not None:
+        req.add_header("Content-Type", "application/json")
+        req.data = json.dumps(payload).encode()
+    return req
+
+def load_published():
+    """Refresh _published from the file currently on GitHub."""
+    _published.update(sha=None, stats=None)
+    try:
+        data = json.loads(request(github_request(), timeout=10, retries=2).decode())
+        _published["sha"] = data.get("sha")
+        _published["stats"] = json.loads(base64.b64decode(data.get("content", "")))
+    except (OSError, ValueError, CircuitOpen):
+        pass  # File doesn't exist yet
+
+def same_stats(a, b):
+    """Equal apart from the timestamp"""
+    strip = lambda s: {k: v for k, v in (s or {}).items() if k != "updated_at"}
+    return a is not None and b is not None and strip(a) == strip(b)
+
 def save_to_github(stats):
     """Save stats.json to GitHub repo."""
     if not GITHUB_TOKEN:
@@ -109,59 +259,81 @@ def save_to_github(stats):
     content = json.dumps(stats, indent=2)
     content_b64 = base64.b64encode(content.encode()).decode()
     
-    # First, try to get existing file SHA (needed for updates)
-    url = f"https://api.github.com/repos/{GITHUB_REPO}/contents/{GITHUB_FILE}"
-    req = urllib.request.Request(url)
-    req.add_header("Authorization", f"token {GITHUB_TOKEN}")
-    req.add_header("Accept", "application/vnd.github.v3+json")
-    
-    sha = None
-    try:
-        with urllib.request.urlopen(req) as resp:
-            data = json.loads(resp.read().decode())
-            sha = data.get("sha")
-    except:
-        pass  # File doesn't exist yet
+    # The SHA is needed for updates; only ask GitHub when we don't have it
+    if not _published["sha"]:
+        load_published()
     
     # Create or update file
     payload = {
         "message": f"Update MRR stats - {datetime.utcnow().strftime('%Y-%m-%d %H:%M')} UTC",
         "content": content_b64,
     }
-    if sha:
-        payload["sha"] = sha
-    
-    req = urllib.request.Request(url, method="PUT")
-    req.add_header("Authorization", f"token {GITHUB_TOKEN}")
-    req.add_header("Accept", "application/vnd.github.v3+json")
-    req.add_header("Content-Type", "application/json")
-    req.data = json.dumps(payload).encode()
+    if _published["sha"]:
+        payload["sha"] = _published["sha"]
     
     try:
-        with urllib.request.urlopen(req) as resp:
-            print(f"✓ Saved to GitHub: {GITHUB_FILE}")
-            return True
+        resp = json.loads(request(github_request("PUT", payload), timeout=15).decode())
+    except urllib.error.HTTPError as e:
+        if e.code in (409, 422):
+            _published["sha"] = None  # someone else changed the file; refetch next time
+        print(f"GitHub error: {e}")
+        return False
     except Exception as e:
         print(f"GitHub error: {e}")
         return False
 
+    _published["sha"] = resp.get("content", {}).get("sha")
+    _published["stats"] = stats
+    print(f"✓ Saved to GitHub: {GITHUB_FILE}")
+    return True
+
 # ============================================================================
 # LOCAL: SAVE STATS (backup)
 # ============================================================================
 
-def save_local(stats):
-    """Save stats locally as backup."""
-    with open("stats.json", "w") as f:
+def save_local(stats, path="stats.json"):
+    """Save stats locally as backup (atomically, so readers never see half a file)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
         json.dump(stats, f, indent=2)
-    print(f"✓ Saved locally: stats.json")
+    os.replace(tmp, path)
+    print(f"✓ Saved locally: {path}")
+
+# ============================================================================
+# DAEMON
+# ============================================================================
+
+def daemon(interval=60):
+    """Poll Stripe every `interval` seconds; publish only when the numbers move."""
+    print(f"MRR daemon: polling every {interval}s")
+    if GITHUB_TOKEN:
+        load_published()
+    last = _published["stats"]
+
+    while True:
+        stats = get_stripe_mrr_incremental()
+        if stats and not same_stats(stats, last):
+            print(f"MRR: ${stats['mrr_dollars']} ({stats['customers']} customers)")
+            save_local(stats)
+            if not GITHUB_TOKEN or save_to_github(stats):
+                last = stats  # a failed publish is retried on the next poll
+        time.sleep(interval)
 
 # ============================================================================
 # MAIN
 # ============================================================================
 
 def main():
+    if "--daemon" in sys.argv:
+        interval = int(sys.argv[sys.argv.index("--interval") + 1]) if "--interval" in sys.argv else 60
+        try:
+            daemon(interval)
+        except KeyboardInterrupt:
+            pass
+        return
+
     print("Fetching MRR from Stripe...")
-    stats = get_stripe_mrr()
+    stats = get_stripe_mrr_incremental() if "--incremental" in sys.argv else get_stripe_mrr()
     
     if not stats:
         print("Failed to fetch stats")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+OUTBOUND HTTP
+=============
+
+One way out for every call we make to someone else's server
+(SearXNG, Stripe, GitHub). Per host it keeps:
+
+- A circuit breaker: after FAILURE_THRESHOLD failures in a row the host is
+  skipped for COOLDOWN seconds, then a single trial call decides whether it
+  closes again.
+- An adaptive timeout: 3x the host's observed p95 latency, clamped between
+  MIN_TIMEOUT and the caller's limit.
+- Counters for calls, failures, timeouts, retries and rejected calls.
+
+Usage:
+    from outbound import request, CircuitOpen
+    body = request(urllib.request.Request(url), timeout=10, retries=2)
+"""
+
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from urllib.parse import urlparse
+
+MIN_TIMEOUT = 1.5        # never time out faster than this
+FAILURE_THRESHOLD = 5    # consecutive failures that open the breaker
+COOLDOWN = 30            # seconds an open breaker rejects calls
+LATENCY_WINDOW = 200     # recent successful latencies kept per host
+LATENCY_MIN_SAMPLES = 20 # use the caller's timeout until we have this many
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a host whose breaker is open."""
+
+class Host:
+    """Breaker state, latency window and counters for one host."""
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.stats = {"calls": 0, "ok": 0, "failures": 0, "timeouts": 0, "retries": 0, "rejected": 0}
+
+    def p95(self):
+        if len(self.latencies) < LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def timeout(self, limit):
+        p95 = self.p95()
+        return limit if p95 is None else max(MIN_TIMEOUT, min(limit, p95 * 3))
+
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.time() - self.opened_at >= COOLDOWN else "open"
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is not None:
+                if time.time() - self.opened_at < COOLDOWN or self.trial:
+                    self.stats["rejected"] += 1
+                    return False
+                self.trial = True  # let exactly one call through to test the host
+            self.stats["calls"] += 1
+            return True
+
+    def success(self, elapsed):
+        with self.lock:
+            self.latencies.append(elapsed)
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+            self.stats["ok"] += 1
+
+    def failure(self, timed_out=False):
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            self.stats["failures"] += 1
+            if timed_out:
+                self.stats["timeouts"] += 1
+            if self.failures >= FAILURE_THRESHOLD:
+                self.opened_at = time.time()
+
+_hosts = {}
+_hosts_lock = threading.Lock()
+
+def host_for(url):
+    name = urlparse(url).netloc.lower()
+    with _hosts_lock:
+        if name not in _hosts:
+            _hosts[name] = Host(name)
+        return _hosts[name]
+
+def _timed_out(e):
+    return isinstance(e, TimeoutError) or isinstance(getattr(e, "reason", None), TimeoutError)
+
+def request(req, timeout=10, retries=0, backoff=0.25):
+    """Send a request through its host's breaker and return the body bytes.
+
+    4xx responses (except 429) are raised as HTTPError straight away: the
+    host is healthy, the request isn't. Timeouts, connection errors, 429
+    and 5xx count as failures and are retried up to `retries` times with
+    full-jitter exponential backoff. Only pass retries for idempotent calls.
+    """
+    if isinstance(req, str):
+        req = urllib.request.Request(req)
+    host = host_for(req.full_url)
+    error = None
+
+    for attempt in range(retries + 1):
+        if attempt:
+            with host.lock:
+                host.stats["retries"] += 1
+            time.sleep(random.uniform(0, backoff * 2 ** attempt))
+        if not host.allow():
+            raise CircuitOpen(f"{host.name} is failing; skipping for up to {COOLDOWN}s")
+
+        start = time.monotonic()
+        try:
+            with urllib.request.urlopen(req, timeout=host.timeout(timeout)) as resp:
+                body = resp.read()
+        except urllib.error.HTTPError as e:
+            if e.code < 500 and e.code != 429:
+                host.success(time.monotonic() - start)
+                raise
+            host.failure()
+            error = e
+        except OSError as e:  # URLError, timeouts, resets
+            host.failure(_timed_out(e))
+            error = e
+        except Exception:
+            # IncompleteRead, BadStatusLine, ...: count it (which also frees a
+            # half-open trial slot) and let the caller see it
+            host.failure()
+            raise
+        else:
+            host.success(time.monotonic() - start)
+            return body
+
+    raise error
+
+def metrics():
+    """Snapshot of per-host counters, p95 latency and breaker state."""
+    with _hosts_lock:
+        hosts = list(_hosts.values())
+    return {
+        h.name: dict(h.stats, p95_ms=round(h.p95() * 1000) if h.p95() else None, state=h.state())
+        for h in hosts
+    }
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+RATE LIMITING
+=============
+
+In-memory token buckets, one per key (an API token, an IP, ...). Each bucket
+holds up to `burst` tokens and refills at `rate` tokens per second; a request
+spends one.
+
+Buckets are spread over `shards` independently locked LRU tables, so threads
+checking different keys rarely wait on each other, and at most `max_keys`
+buckets are kept: the least recently used are dropped first. A dropped key
+was idle longest and comes back with a full bucket, which is what it would
+have refilled to anyway unless it was hammering and then paused.
+
+Usage:
+    from ratelimit import RateLimiter, client_ip
+    api_limit = RateLimiter(rate=1, burst=30)
+    ok, retry_after = api_limit.allow(token)
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # key -> [tokens, updated_at], oldest use first
+
+class RateLimiter:
+    """Token buckets keyed by caller."""
+
+    def __init__(self, rate, burst, max_keys=100000, shards=16):
+        self.rate = rate
+        self.burst = burst
+        self.shards = [_Shard() for _ in range(shards)]
+        self.max_per_shard = max(1, max_keys // shards)
+
+    def allow(self, key, cost=1):
+        """Spend `cost` tokens from key's bucket.
+
+        Returns (True, 0) if allowed, else (False, seconds until it would be).
+        """
+        shard = self.shards[hash(key) % len(self.shards)]
+        now = time.monotonic()
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = shard.buckets[key] = [self.burst, now]
+                if len(shard.buckets) > self.max_per_shard:
+                    shard.buckets.popitem(last=False)
+            else:
+                shard.buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True, 0
+            return False, (cost - bucket[0]) / self.rate
+
+    def __len__(self):
+        return sum(len(s.buckets) for s in self.shards)
+
+LOOPBACK = ("127.0.0.1", "::1")
+PROXIES = (None, "cloudflare", "xff")
+
+def client_ip(handler, proxy=None):
+    """The caller's IP for a BaseHTTPRequestHandler.
+
+    `proxy` says what runs in front of the server, on this machine:
+    None trusts no headers; "cloudflare" (cloudflared tunnel) trusts
+    CF-Connecting-IP, which Cloudflare overwrites; "xff" (nginx and the like)
+    trusts only the rightmost X-Forwarded-For entry, the one the proxy
+    appended; anything to its left came from the client. Headers are only
+    read when the request arrives from loopback.
+    """
+    if proxy not in PROXIES:
+        raise ValueError(f"unknown proxy {proxy!r}")
+    peer = handler.client_address[0]
+    if peer not in LOOPBACK or proxy is None:
+        return peer
+    if proxy == "cloudflare":
+        forwarded = handler.headers.get("CF-Connecting-IP", "")
+    else:
+        forwarded = handler.headers.get("X-Forwarded-For", "").split(",")[-1]
+    return forwarded.strip() or peer
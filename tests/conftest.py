@@ -0,0 +1,49 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import content_registry
+import d2d
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """content_registry with its database and store under tmp_path"""
+    monkeypatch.setattr(content_registry, "DB", str(tmp_path / "content.db"))
+    monkeypatch.setitem(content_registry.CONFIG, "store_folder", str(tmp_path / "store"))
+    content_registry._certificate_cache.clear()
+    content_registry.init_db()
+    return content_registry
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """d2d with a fresh bootstrapped database under tmp_path and empty caches"""
+    monkeypatch.setattr(d2d, "DB", str(tmp_path / "d2d.db"))
+    monkeypatch.chdir(tmp_path)
+    for cache in (d2d._versions, d2d._projects, d2d._user_stars, d2d._search_cache):
+        cache.clear()
+    d2d.bootstrap()
+    return d2d
+
+
+@pytest.fixture
+def serve():
+    """Start a handler class on a free port; returns its base URL"""
+    servers = []
+
+    def start(handler):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
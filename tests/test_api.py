@@ -0,0 +1,28 @@
+import json
+import urllib.error
+import urllib.request
+
+
+def get(url, token=None):
+    req = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"} if token else {})
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_api_search_takes_only_api_tokens(app, serve):
+    session, _ = app.signup("alice@example.com")
+    user_id = app.login(session)["id"]
+    api = app.create_api_token(user_id)
+    assert app.login(api) is None
+    base = serve(app.H)
+
+    # No q, so an accepted token stops at 400 without searching upstream
+    assert get(f"{base}/api/search", api) == (400, {"error": "Missing q"})
+    assert get(f"{base}/api/search", session)[0] == 401
+    assert get(f"{base}/api/search?token={api}")[0] == 401
+
+    app.revoke_api_token(user_id, app.get_api_tokens(user_id)[0]["id"])
+    assert get(f"{base}/api/search", api)[0] == 401
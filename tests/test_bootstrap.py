@@ -0,0 +1,11 @@
+def test_db_stamped_at_2_gets_api_tokens(app):
+    conn = app.db()
+    conn.execute("DROP TABLE api_tokens")
+    conn.execute("PRAGMA user_version = 2")
+    conn.commit()
+    conn.close()
+
+    assert app.bootstrap()
+    token, _ = app.signup("alice@example.com")
+    assert app.create_api_token(app.login(token)["id"]).startswith("d2d_")
+    assert not app.bootstrap()
@@ -0,0 +1,126 @@
+import io
+import os
+
+import pytest
+
+
+class FailingBody(io.BytesIO):
+    """Request body whose read fails partway, like a full disk or a reset socket"""
+
+    def read(self, n=-1):
+        if self.tell() > 0:
+            raise OSError("No space left on device")
+        return super().read(n)
+
+
+def spool_files(registry):
+    store = registry.CONFIG["store_folder"]
+    return [f for f in os.listdir(store) if f.startswith(".upload-")] if os.path.isdir(store) else []
+
+
+def test_upload_stores_file(registry):
+    body = b"hello world" * 1000
+    file_hash, size, stored, chunks, err = registry.receive_upload(io.BytesIO(body), len(body), store=True)
+    assert err is None and size == len(body)
+    assert open(stored, "rb").read() == body
+    assert spool_files(registry) == []
+
+
+def test_upload_short_body_removes_spool(registry):
+    _, _, stored, _, err = registry.receive_upload(io.BytesIO(b"abc"), 10, store=True)
+    assert err == "Upload ended early" and stored is None
+    assert spool_files(registry) == []
+
+
+def test_upload_io_error_removes_spool(registry, monkeypatch):
+    monkeypatch.setitem(registry.CONFIG, "upload_chunk_size", 4)
+    with pytest.raises(OSError):
+        registry.receive_upload(FailingBody(b"x" * 64), 64, store=True)
+    assert spool_files(registry) == []
+
+
+def test_upload_rejects_bad_content_length(registry, serve):
+    import http.client
+    from urllib.parse import urlparse
+
+    token, _ = registry.signup("a@example.com")
+    url = urlparse(serve(registry.RequestHandler))
+    conn = http.client.HTTPConnection(url.hostname, url.port)
+    conn.putrequest("POST", "/upload?filename=x.txt")
+    conn.putheader("X-Token", token)
+    conn.putheader("Content-Length", "abc")
+    conn.endheaders()
+    assert conn.getresponse().status == 400
+
+
+def test_stalled_upload_does_not_block_other_requests(registry, serve, monkeypatch):
+    import http.client
+    import urllib.request
+    from urllib.parse import urlparse
+
+    monkeypatch.setattr(registry.RequestHandler, "timeout", 1)
+    token, _ = registry.signup("a@example.com")
+    base = serve(registry.RequestHandler)
+    url = urlparse(base)
+    stalled = http.client.HTTPConnection(url.hostname, url.port, timeout=5)
+    stalled.putrequest("POST", "/upload?filename=x.txt&store=1")
+    stalled.putheader("X-Token", token)
+    stalled.putheader("Content-Length", "1000000")
+    stalled.endheaders()
+    stalled.send(b"abc")
+
+    with urllib.request.urlopen(base + "/", timeout=0.5) as resp:
+        assert resp.status == 200
+    assert stalled.getresponse().status == 408
+    assert spool_files(registry) == []
+
+
+def test_batch_verify_refuses_paths_outside_roots(registry, tmp_path):
+    inside = tmp_path / "store" / "a.txt"
+    inside.parent.mkdir()
+    inside.write_text("hi")
+    outside = tmp_path / "secret.txt"
+    outside.write_text("hi")
+    roots = [str(tmp_path / "store")]
+    escape = str(tmp_path / "store" / ".." / "secret.txt")
+
+    results = {r["path"]: r["message"] for r in registry.verify_batch(
+        [("u1", str(inside)), ("u2", str(outside)), ("u3", escape), ("u4", "/etc/passwd")], roots=roots)}
+    assert results[str(inside)] == "UUID not found"
+    assert results[str(outside)] == results[escape] == results["/etc/passwd"] == "Path not allowed"
+
+
+def test_verify_chunks_missing_file(registry, tmp_path, monkeypatch):
+    monkeypatch.setitem(registry.CONFIG, "merkle_chunk_size", 4)
+    path = tmp_path / "big.bin"
+    path.write_bytes(b"0123456789abcdef")
+    file_hash, chunks = registry.hash_file_with_chunks(str(path))
+    registry.signup("a@example.com")
+    user_id = registry.get_db().execute("SELECT id FROM users").fetchone()["id"]
+    content_uuid, err = registry.save_content(file_hash, "big.bin", str(path), 16, user_id, chunks=chunks)
+    assert err is None
+
+    assert registry.verify_chunks(content_uuid, str(path))[0]
+    path.unlink()
+    assert registry.verify_chunks(content_uuid, str(path)) == (False, "File not found", [])
+
+
+def test_json_apis_take_the_token_from_the_header_only(registry, serve):
+    import urllib.error
+    import urllib.request
+
+    token, _ = registry.signup("a@example.com")
+    base = serve(registry.RequestHandler)
+
+    def status(path, data=None, headers=None):
+        req = urllib.request.Request(base + path, data=data, headers=headers or {})
+        try:
+            with urllib.request.urlopen(req, timeout=5) as resp:
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    assert status("/api/content", headers={"X-Token": token}) == 200
+    assert status(f"/api/content?token={token}") == 401
+    assert status(f"/upload?filename=x.txt&token={token}", data=b"hello") == 401
+    assert status("/upload?filename=x.txt", data=b"hello", headers={"X-Token": token}) == 201
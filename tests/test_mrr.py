@@ -0,0 +1,97 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import mrr
+
+
+def sub(sub_id, cents, interval="month", status="active"):
+    return {"id": sub_id, "customer": f"cus_{sub_id}", "status": status,
+            "items": {"data": [{"price": {"unit_amount": cents, "recurring": {"interval": interval}}}]}}
+
+
+class StripeStub(BaseHTTPRequestHandler):
+    """Just enough of /v1/subscriptions and /v1/events for the snapshot sync"""
+    pages = {}     # starting_after (or None) -> list page
+    events = []
+    requests = []  # (path, query)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.requests.append((url.path, query))
+        if url.path == "/v1/subscriptions":
+            body = self.pages[query.get("starting_after", [None])[0]]
+        else:
+            since = int(query["created[gte]"][0])
+            body = {"data": [e for e in self.events if e["created"] >= since], "has_more": False}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *a):
+        pass
+
+
+@pytest.fixture
+def stripe(tmp_path, monkeypatch, serve):
+    StripeStub.pages = {
+        None: {"data": [sub("sub_1", 1000), sub("sub_2", 12000, "year")], "has_more": True},
+        "sub_2": {"data": [sub("sub_3", 500)], "has_more": False},
+    }
+    StripeStub.events = []
+    StripeStub.requests = []
+    monkeypatch.setattr(mrr, "STRIPE_API", serve(StripeStub))
+    monkeypatch.setattr(mrr, "STRIPE_KEY", "sk_test")
+    monkeypatch.setattr(mrr, "SNAPSHOT_DB", str(tmp_path / "mrr.db"))
+    return StripeStub
+
+
+def list_calls(stripe):
+    return [q.get("starting_after", [None])[0] for p, q in stripe.requests if p == "/v1/subscriptions"]
+
+
+def test_full_sync_then_events(stripe):
+    stats = mrr.get_stripe_mrr_incremental()
+    assert list_calls(stripe) == [None, "sub_2"]  # both pages
+    assert (stats["mrr_cents"], stats["customers"]) == (2500, 3)
+
+    now = int(time.time())
+    stripe.events = [
+        {"type": "customer.subscription.updated", "created": now + 10, "data": {"object": sub("sub_1", 2000)}},
+        # Older than the snapshot row, so it must not win even though it's pulled
+        {"type": "customer.subscription.updated", "created": now - 1000, "data": {"object": sub("sub_2", 99999)}},
+        {"type": "customer.subscription.deleted", "created": now + 5, "data": {"object": sub("sub_3", 500)}},
+    ]
+    stats = mrr.get_stripe_mrr_incremental()
+    assert list_calls(stripe) == [None, "sub_2"]  # no resync, just the events
+    assert (stats["mrr_cents"], stats["customers"]) == (3000, 2)
+
+    conn = mrr.snapshot_db()
+    assert conn.execute("SELECT status FROM subscriptions WHERE id = 'sub_3'").fetchone()[0] == "canceled"
+    assert conn.execute("SELECT value FROM sync_state").fetchone()[0] == now + 10
+    conn.close()
+
+    # The next pull starts from the newest event seen
+    mrr.get_stripe_mrr_incremental()
+    assert stripe.requests[-1][1]["created[gte]"] == [str(now + 10)]
+
+
+def test_stale_snapshot_gets_full_resync(stripe):
+    mrr.get_stripe_mrr_incremental()
+    conn = mrr.snapshot_db()
+    conn.execute("UPDATE sync_state SET value = ?", (int(time.time()) - mrr.EVENT_WINDOW - 10,))
+    conn.commit()
+    conn.close()
+
+    stripe.pages[None] = {"data": [sub("sub_4", 700)], "has_more": False}
+    stats = mrr.get_stripe_mrr_incremental()
+    assert list_calls(stripe) == [None, "sub_2", None]
+    assert not any(p == "/v1/events" for p, q in stripe.requests)
+    assert (stats["mrr_cents"], stats["customers"]) == (700, 1)
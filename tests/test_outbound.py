@@ -0,0 +1,56 @@
+import http.client
+import time
+import urllib.request
+
+import pytest
+
+import outbound
+
+
+class Body:
+    def __init__(self, data=b"ok"):
+        self.data = data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def read(self):
+        return self.data
+
+
+def open_breaker(url):
+    host = outbound.host_for(url)
+    host.failures = outbound.FAILURE_THRESHOLD
+    host.opened_at = time.time() - outbound.COOLDOWN - 1  # cooled down: next call is the trial
+    return host
+
+
+def test_half_open_trial_released_after_non_oserror(monkeypatch):
+    url = "http://trial-release.test/x"
+    host = open_breaker(url)
+
+    def broken(req, timeout):
+        raise http.client.IncompleteRead(b"partial")
+
+    monkeypatch.setattr(urllib.request, "urlopen", broken)
+    with pytest.raises(http.client.IncompleteRead):
+        outbound.request(url)
+    assert host.trial is False
+
+    # Once cooled down again, another trial goes through and closes the breaker
+    host.opened_at = time.time() - outbound.COOLDOWN - 1
+    monkeypatch.setattr(urllib.request, "urlopen", lambda req, timeout: Body())
+    assert outbound.request(url) == b"ok"
+    assert host.state() == "closed"
+
+
+def test_open_breaker_rejects(monkeypatch):
+    url = "http://open-breaker.test/x"
+    host = open_breaker(url)
+    host.opened_at = time.time()
+    monkeypatch.setattr(urllib.request, "urlopen", lambda req, timeout: Body())
+    with pytest.raises(outbound.CircuitOpen):
+        outbound.request(url)
@@ -0,0 +1,29 @@
+def user(d2d, email):
+    token, _ = d2d.signup(email)
+    return d2d.login(token)["id"]
+
+
+def test_star_only_invalidates_the_starring_user(app):
+    app.add_project("Demo", "https://example.com", "demo", "tools")
+    project = app.get_projects()[0]["id"]
+    alice, bob = user(app, "alice@example.com"), user(app, "bob@example.com")
+
+    bobs = app.get_user_stars(bob)
+    assert app.get_user_stars(alice) == frozenset()
+
+    assert app.star_project(alice, project)
+    assert alice not in app._user_stars
+    assert app._user_stars[bob][2] is bobs
+    assert app.get_user_stars(alice) == {project}
+
+
+def test_stale_set_refetched_after_counter_moves(app):
+    app.add_project("Demo", "https://example.com", "demo", "tools")
+    project = app.get_projects()[0]["id"]
+    alice = user(app, "alice@example.com")
+    assert app.get_user_stars(alice) == frozenset()
+
+    # Another worker's star: the counter moves but this process's entry stays
+    app.star_project(alice, project)
+    app._user_stars[alice] = (0, 0, frozenset())
+    assert app.get_user_stars(alice) == {project}
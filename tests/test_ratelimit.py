@@ -0,0 +1,104 @@
+import pytest
+
+from ratelimit import RateLimiter, client_ip
+
+
+class Handler:
+    def __init__(self, peer, **headers):
+        self.client_address = (peer, 12345)
+        self.headers = {k.replace("_", "-"): v for k, v in headers.items()}
+
+
+def test_xff_uses_the_proxy_appended_entry():
+    spoofed = Handler("127.0.0.1", X_Forwarded_For="6.6.6.6, 203.0.113.9")
+    assert client_ip(spoofed, "xff") == "203.0.113.9"
+
+
+def test_headers_only_trusted_as_configured():
+    h = Handler("127.0.0.1", CF_Connecting_IP="198.51.100.7", X_Forwarded_For="6.6.6.6")
+    assert client_ip(h, "cloudflare") == "198.51.100.7"
+    assert client_ip(h) == "127.0.0.1"
+    assert client_ip(Handler("192.0.2.1", CF_Connecting_IP="6.6.6.6"), "cloudflare") == "192.0.2.1"
+    assert client_ip(Handler("127.0.0.1", X_Forwarded_For="6.6.6.6"), "cloudflare") == "127.0.0.1"
+    with pytest.raises(ValueError):
+        client_ip(h, "nginx")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    import ratelimit
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_spends_burst_then_refills(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.allow("k")[0] for _ in range(3)] == [True] * 3
+    assert limiter.allow("k") == (False, 0.5)
+
+    clock.now += 0.5
+    assert limiter.allow("k") == (True, 0)
+    assert not limiter.allow("k")[0]
+
+    clock.now += 60  # refill stops at burst
+    assert [limiter.allow("k")[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow("other") == (True, 0)
+
+
+def test_keys_bounded_by_max_keys(clock):
+    limiter = RateLimiter(rate=1, burst=1, max_keys=8, shards=2)
+    for i in range(100):
+        limiter.allow(i)
+    assert len(limiter) <= 8
+    assert all(len(s.buckets) <= 4 for s in limiter.shards)
+
+    # The least recently used keys went first and come back with a full bucket
+    assert limiter.allow(0) == (True, 0)
+    assert not limiter.allow(99)[0]
+
+
+def status(req):
+    import urllib.error
+    import urllib.request
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, None
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get("Retry-After")
+
+
+def test_ip_bucket_answers_429_with_retry_after(app, serve, monkeypatch):
+    monkeypatch.setattr(app.H, "ip_limit", RateLimiter(rate=0.1, burst=2))
+    base = serve(app.H)
+    assert status(base + "/stats.json")[0] == 200
+    assert status(base + "/changelog")[0] == 200
+    assert status(base + "/changelog") == (429, "10")
+
+
+def test_signup_and_login_share_the_auth_bucket(app, serve, monkeypatch):
+    import urllib.request
+    monkeypatch.setattr(app.H, "auth_limit", RateLimiter(rate=0.5, burst=1))
+    base = serve(app.H)
+    signup = urllib.request.Request(base + "/signup", data=b"email=a%40example.com")
+    login = urllib.request.Request(base + "/login", data=b"token=nope")
+    assert status(signup)[0] == 200
+    assert status(login) == (429, "2")
+    assert status(base + "/changelog")[0] == 200  # GETs don't spend auth tokens
+
+
+def test_registry_write_bucket_answers_429(registry, serve, monkeypatch):
+    import urllib.request
+    monkeypatch.setattr(registry.RequestHandler, "write_limit", RateLimiter(rate=0.3, burst=1))
+    base = serve(registry.RequestHandler)
+    assert status(urllib.request.Request(base + "/verify/batch", data=b"[]"))[0] == 401
+    assert status(urllib.request.Request(base + "/verify/batch", data=b"[]")) == (429, "4")
+    assert status(base + "/")[0] == 200
@@ -0,0 +1,23 @@
+def test_index_trims_to_budget_periodically(app, monkeypatch):
+    monkeypatch.setattr(app, "SEARCH_INDEX_MAX_DOCS", 5)
+    monkeypatch.setattr(app, "SEARCH_INDEX_TRIM_EVERY", 3)
+    monkeypatch.setattr(app, "_index_writes", 0)
+    count = lambda: app.db().execute("SELECT COUNT(*) FROM search_docs").fetchone()[0]
+
+    for batch in range(4):
+        app.index_results([app.Result(f"t{batch}{i}", f"http://e{batch}.com/{i}") for i in range(4)])
+        if batch == 0:
+            assert count() == 4
+    # writes 2 and 3 skip the check, write 4 trims back to the budget
+    assert count() == 5
+
+
+def test_merge_survives_malformed_urls(app):
+    bad_port = app.Result("bad port", "http://e.com:abc/x")
+    bad_host = app.Result("bad host", "http://[::1/x")
+    good = app.Result("good", "https://www.example.com/a?utm_source=x")
+    same = app.Result("same", "http://example.com/a/")
+
+    merged = app.merge_results([[bad_port, good], [bad_host, same]])
+    assert {r.title for r in merged} == {"bad port", "bad host", "good"}
+    assert bad_host.host == ""
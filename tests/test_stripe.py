@@ -0,0 +1,49 @@
+import pytest
+
+
+def completed(event_id="evt_1", email="a@example.com"):
+    session = {"id": "cs_1", "status": "complete", "payment_status": "paid",
+               "customer": "cus_1", "customer_details": {"email": email}}
+    return {"id": event_id, "type": "checkout.session.completed", "data": {"object": session}}
+
+
+def tier(d2d, email):
+    conn = d2d.db()
+    row = conn.execute("SELECT tier FROM users WHERE email = ?", (email,)).fetchone()
+    conn.close()
+    return row and row["tier"]
+
+
+def recorded(d2d, event_id):
+    conn = d2d.db()
+    row = conn.execute("SELECT 1 FROM stripe_events WHERE id = ?", (event_id,)).fetchone()
+    conn.close()
+    return row is not None
+
+
+def test_failed_event_is_not_recorded_and_retry_applies(app, monkeypatch):
+    def broken(conn, session):
+        conn.execute("INSERT INTO checkout_sessions (session_id, status) VALUES ('cs_1', 'paid')")
+        raise RuntimeError("boom")
+
+    with monkeypatch.context() as m:
+        m.setattr(app, "store_checkout", broken)
+        with pytest.raises(RuntimeError):
+            app.handle_stripe_event(completed())
+    assert not recorded(app, "evt_1")
+    assert app.checkout_row("cs_1") is None
+
+    assert app.handle_stripe_event(completed())
+    assert recorded(app, "evt_1")
+    assert tier(app, "a@example.com") == "member"
+
+
+def test_duplicate_event_is_ignored(app):
+    assert app.handle_stripe_event(completed())
+    conn = app.db()
+    conn.execute("UPDATE users SET tier = 'free' WHERE email = 'a@example.com'")
+    conn.commit()
+    conn.close()
+
+    assert not app.handle_stripe_event(completed())
+    assert tier(app, "a@example.com") == "free"
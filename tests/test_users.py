@@ -0,0 +1,23 @@
+def checkout(d2d, session_id, email, customer):
+    d2d.remember_checkout({"id": session_id, "status": "complete", "payment_status": "paid",
+                           "customer": customer, "customer_details": {"email": email}})
+
+
+def test_delete_all_removes_checkout_sessions(app):
+    checkout(app, "cs_a", "alice@example.com", "cus_a")
+    checkout(app, "cs_b", "bob@example.com", "cus_b")
+    conn = app.db()
+    # A later session where Alice paid under another address, same customer
+    conn.execute("INSERT INTO checkout_sessions (session_id, email, customer_id, status) VALUES ('cs_a2', 'alt@example.com', 'cus_a', 'paid')")
+    conn.commit()
+    alice = conn.execute("SELECT id FROM users WHERE email = 'alice@example.com'").fetchone()["id"]
+    conn.close()
+
+    app.delete_all(alice)
+
+    conn = app.db()
+    sessions = {r["session_id"] for r in conn.execute("SELECT session_id FROM checkout_sessions")}
+    users = {r["email"] for r in conn.execute("SELECT email FROM users")}
+    conn.close()
+    assert sessions == {"cs_b"}
+    assert users == {"bob@example.com"}